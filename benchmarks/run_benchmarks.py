@@ -0,0 +1,206 @@
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import subprocess
+import time
+from datetime import datetime
+
+import polars as pl
+
+from benchmarks.synthetic_data import SEARCH_COLS, SITEWIDE_COLS, generate_synthetic_data
+
+
+def _sessions(files: dict[str, str]) -> pl.LazyFrame:
+    return pl.scan_parquet(files["train_sessions"]).with_columns(
+        pl.col("ts_hour").dt.truncate("1d").cast(pl.Datetime("ms")).alias("date")
+    )
+
+
+def _user_history(files: dict[str, str]):
+    from helpers.user_history import add_user_history
+    return lambda: add_user_history(_sessions(files), pl.scan_parquet(files["user/sitewide_log"]), aligned=True)
+
+
+def _time_history(files: dict[str, str]):
+    from helpers.time_history import add_time_history
+    return lambda: add_time_history(_sessions(files), pl.scan_parquet(files["user/sitewide_log"]), aligned=True)
+
+
+def _time_history_nulls(files: dict[str, str]):
+    # log'daki eksik sayımlar (null) rolling pencerelerinde atlanmalı, hata vermemeli
+    from helpers.time_history import add_time_history
+    log = pl.scan_parquet(files["user/sitewide_log"]).with_columns(
+        *[pl.when(pl.int_range(pl.len()) % 7 == i).then(None).otherwise(pl.col(col)).alias(col) for i, col in enumerate(SITEWIDE_COLS)]
+    )
+    return lambda: add_time_history(_sessions(files), log, aligned=True)
+
+
+def _decay_features_multiple(files: dict[str, str]):
+    from helpers.decay_features import add_decay_features_multiple
+    return lambda: add_decay_features_multiple(
+        _sessions(files), pl.scan_parquet(files["user/fashion_sitewide_log"]), interaction_cols=SITEWIDE_COLS,
+        rolling_windows=[3, 12], alias="fashion_site", aligned=True
+    )
+
+
+def _time_history_streaming(files: dict[str, str]):
+    from helpers.streaming import stream_block
+    from helpers.time_history import add_time_history
+    path = os.path.join(os.path.dirname(files["train_sessions"]), "stream", "add_time_history")
+    return lambda: stream_block(add_time_history, _sessions(files), path, df_value=pl.scan_parquet(files["user/sitewide_log"]), aligned=True)
+
+
+def _decay_features_multiple_streaming(files: dict[str, str]):
+    from helpers.decay_features import add_decay_features_multiple
+    from helpers.streaming import stream_block
+    path = os.path.join(os.path.dirname(files["train_sessions"]), "stream", "add_decay_features_multiple")
+    return lambda: stream_block(
+        add_decay_features_multiple, _sessions(files), path, interactions_df=pl.scan_parquet(files["user/fashion_sitewide_log"]),
+        interaction_cols=SITEWIDE_COLS, rolling_windows=[3, 12], alias="fashion_site", aligned=True
+    )
+
+
+def _content_price_history(files: dict[str, str]):
+    from helpers.content_history import add_content_price_history
+    return lambda: add_content_price_history(
+        _sessions(files), pl.scan_parquet(files["content/price_rate_review_data"]),
+        pl.scan_parquet(files["content/metadata"]), exact_match=True, aligned=True
+    )
+
+
+def _session_ranking(files: dict[str, str]):
+    from helpers.content_history import add_content_price_history
+    from helpers.session_history import session_based_ranking_for_contents
+    from helpers.user_history import add_user_history, add_user_term_history
+
+    # ranking'in okuduğu content kolonları zamanlanmayan hazırlık adımında üretilir
+    df = _sessions(files)
+    df = add_user_history(df, pl.scan_parquet(files["content/sitewide_log"]), user_col="content_id_hashed", time_col="date",
+                          interaction_cols=SITEWIDE_COLS, alias="content_sitewide")
+    df = add_user_history(df, pl.scan_parquet(files["content/search_log"]), user_col="content_id_hashed", time_col="date",
+                          interaction_cols=SEARCH_COLS, ratio_groups=[tuple(SEARCH_COLS)], alias="content_search",
+                          weights={"total_search_impression": 0.1, "total_search_click": 0.9})
+    df = add_user_term_history(df, pl.scan_parquet(files["content/top_terms_log"]), user_col="content_id_hashed", time_col="date",
+                               alias="content_top_terms")
+    df = add_content_price_history(df, pl.scan_parquet(files["content/price_rate_review_data"]),
+                                   pl.scan_parquet(files["content/metadata"]), exact_match=True).collect()
+    return lambda: session_based_ranking_for_contents(df)
+
+
+BENCHMARKS = {
+    "add_user_history": _user_history,
+    "add_time_history": _time_history,
+    "add_time_history[nulls]": _time_history_nulls,
+    "add_decay_features_multiple": _decay_features_multiple,
+    "add_time_history[streaming]": _time_history_streaming,
+    "add_decay_features_multiple[streaming]": _decay_features_multiple_streaming,
+    "add_content_price_history": _content_price_history,
+    "session_based_ranking_for_contents": _session_ranking
+}
+
+
+def _run_case(name: str, files: dict[str, str], queue: multiprocessing.Queue) -> None:
+    """
+    Ayrı bir process içinde çalışır; hazırlık sonrası helper'ı çalıştırıp süre, peak RSS ve satır sayısını döndürür.
+    """
+    run = BENCHMARKS[name](files)
+    start = time.perf_counter()
+    result = run()
+    if isinstance(result, pl.LazyFrame):
+        result = result.collect()
+    wall_seconds = time.perf_counter() - start
+    queue.put({
+        "wall_seconds": round(wall_seconds, 4),
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "output_rows": result.height,
+        "output_cols": result.width
+    })
+
+
+def run_benchmarks(
+    scales: list[float],
+    data_path: str,
+    benchmarks: list[str] = None,
+    label: str = None
+) -> list[dict]:
+    """
+    Her scale için sentetik veriyi (yoksa) üretir ve her benchmark'ı peak RSS'in ayrı ölçülmesi için ayrı bir
+    process'te çalıştırır.
+    """
+    label = label or _git_label()
+    context = multiprocessing.get_context("spawn")
+    records = []
+    for scale in scales:
+        files = _synthetic_files(os.path.join(data_path, f"scale_{scale}"), scale)
+        for name in benchmarks or BENCHMARKS:
+            queue = context.Queue()
+            process = context.Process(target=_run_case, args=(name, files, queue))
+            process.start()
+            process.join()
+            if process.exitcode != 0:
+                raise RuntimeError(f"`{name}` benchmark'ı scale={scale} için hata verdi (exit code {process.exitcode}).")
+            record = {"label": label, "benchmark": name, "scale": scale, **queue.get(), "timestamp": datetime.now().isoformat(timespec="seconds")}
+            print(f"{name:<40} scale={scale:<6} {record['wall_seconds']:>9.3f}s {record['peak_rss_mb']:>9.1f}MB {record['output_rows']:>10,} rows")
+            records.append(record)
+    return records
+
+
+def compare_results(records: list[dict], baseline: list[dict]) -> pl.DataFrame:
+    """
+    İki benchmark çalıştırmasını (benchmark, scale) bazında karşılaştırır; oranlar > 1 ise yavaşlama/artış vardır.
+    """
+    keys = ["benchmark", "scale"]
+    return pl.DataFrame(records).join(pl.DataFrame(baseline), on=keys, how="inner", suffix="_baseline").select(
+        *keys,
+        (pl.col("wall_seconds") / pl.col("wall_seconds_baseline")).round(3).alias("wall_ratio"),
+        (pl.col("peak_rss_mb") / pl.col("peak_rss_mb_baseline")).round(3).alias("peak_rss_ratio"),
+        (pl.col("output_rows") == pl.col("output_rows_baseline")).alias("same_rows")
+    )
+
+
+def _synthetic_files(path: str, scale: float) -> dict[str, str]:
+    files = {name: os.path.join(path, f"{name}.parquet") for name in [
+        "train_sessions", "test_sessions", "user/sitewide_log", "user/search_log", "user/fashion_sitewide_log",
+        "user/fashion_search_log", "user/top_terms_log", "term/search_log", "content/sitewide_log",
+        "content/search_log", "content/top_terms_log", "content/price_rate_review_data", "content/metadata",
+        "user/metadata"
+    ]}
+    if not all(os.path.exists(file) for file in files.values()):
+        files = generate_synthetic_data(path, scale=scale)
+    return files
+
+
+def _git_label() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "local"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Helper'ları sentetik veri üzerinde süre ve peak RSS için ölçer.")
+    parser.add_argument("--scales", type=float, nargs="+", default=[0.1, 0.5, 1.0])
+    parser.add_argument("--benchmarks", nargs="+", choices=list(BENCHMARKS), default=None)
+    parser.add_argument("--data-path", default="benchmarks/data")
+    parser.add_argument("--output-path", default="benchmarks/results")
+    parser.add_argument("--label", default=None, help="Sonuç dosyasının adı; varsayılan git commit hash'idir.")
+    parser.add_argument("--compare", default=None, help="Karşılaştırılacak önceki sonucun label'ı.")
+    args = parser.parse_args()
+
+    records = run_benchmarks(args.scales, args.data_path, args.benchmarks, args.label)
+
+    os.makedirs(args.output_path, exist_ok=True)
+    output_file = os.path.join(args.output_path, f"{records[0]['label']}.json")
+    with open(output_file, "w") as f:
+        json.dump(records, f, indent=2)
+    print(f"Sonuçlar {output_file} dosyasına yazıldı.")
+
+    if args.compare is not None:
+        with open(os.path.join(args.output_path, f"{args.compare}.json")) as f:
+            print(compare_results(records, json.load(f)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+import os
+from datetime import datetime
+
+import numpy as np
+import polars as pl
+
+
+SITEWIDE_COLS = ["total_click", "total_cart", "total_fav", "total_order"]
+SEARCH_COLS = ["total_search_impression", "total_search_click"]
+
+# scale=1.0 için entity sayıları ve log satır sayıları; scale ile lineer büyür
+BASE_SIZES = {
+    "users": 20_000,
+    "contents": 50_000,
+    "terms": 5_000,
+    "train_sessions": 4_000,
+    "test_sessions": 1_000,
+    "user/sitewide_log": 400_000,
+    "user/search_log": 200_000,
+    "user/fashion_sitewide_log": 400_000,
+    "user/fashion_search_log": 200_000,
+    "user/top_terms_log": 200_000,
+    "term/search_log": 100_000,
+    "content/sitewide_log": 400_000,
+    "content/search_log": 200_000,
+    "content/top_terms_log": 200_000,
+    "content/price_rate_review_data": 200_000
+}
+
+LOG_START = datetime(2025, 5, 1)
+LOG_HOURS = 60 * 24
+TRAIN_START = datetime(2025, 6, 30)
+TEST_START = datetime(2025, 7, 3)
+
+
+def _power_law_ids(rng: np.random.Generator, n_ids: int, size: int, alpha: float) -> np.ndarray:
+    """
+    0..n_ids-1 arasından p(i) ∝ (i+1)^-alpha olasılıklarıyla id çeker; alpha=0 uniform dağılımdır.
+    """
+    weights = np.arange(1, n_ids + 1, dtype=float) ** -alpha
+    return rng.choice(n_ids, size=size, p=weights / weights.sum())
+
+
+def _hashed(col: str, prefix: str) -> pl.Expr:
+    return pl.concat_str([pl.lit(prefix), pl.col(col).cast(pl.String)]).alias(col)
+
+
+def _hours(col: str, start: datetime, truncate: str = None) -> pl.Expr:
+    ts = pl.lit(start, dtype=pl.Datetime("ms")) + pl.duration(hours=pl.col(col), time_unit="ms")
+    return (ts.dt.truncate(truncate) if truncate else ts).alias(col)
+
+
+def _counts(rng: np.random.Generator, cols: list[str], size: int) -> dict[str, np.ndarray]:
+    """
+    Kolon sırasına göre azalan yoğunlukta (impression > click, click > cart > fav > order) sayımlar üretir.
+    """
+    rates = np.geomspace(3.0, 0.05, len(cols))
+    return {col: rng.poisson(rate, size) for col, rate in zip(cols, rates)}
+
+
+def _log(
+    rng: np.random.Generator,
+    size: int,
+    keys: dict[str, tuple[int, float, str]],
+    time_col: str,
+    cols: list[str],
+    truncate: str = None
+) -> pl.DataFrame:
+    """
+    keys = {kolon: (entity sayısı, power-law alpha, id prefix)} ile (key, time) bazında tekil bir log üretir.
+    """
+    log = pl.DataFrame({
+        **{key: _power_law_ids(rng, n_ids, size, alpha) for key, (n_ids, alpha, _) in keys.items()},
+        time_col: rng.integers(0, LOG_HOURS, size),
+        **_counts(rng, cols, size)
+    })
+    log = log.with_columns(
+        *[_hashed(key, prefix) for key, (_, _, prefix) in keys.items()],
+        _hours(time_col, LOG_START, truncate)
+    )
+    return log.unique(subset=list(keys) + [time_col], keep="first").sort([time_col] + list(keys))
+
+
+def _sessions(
+    rng: np.random.Generator,
+    n_sessions: int,
+    sizes: dict[str, int],
+    start: datetime,
+    n_hours: int,
+    user_alpha: float,
+    content_alpha: float,
+    term_alpha: float,
+    large_session_share: float,
+    large_session_size: int,
+    with_targets: bool
+) -> pl.DataFrame:
+    """
+    Her session bir user, bir arama terimi ve bir saatten oluşur; aday sayısı lognormal dağılır ve
+    large_session_share oranındaki session'lar large_session_size civarında aday içerir.
+    """
+    candidates = np.clip(rng.lognormal(3.5, 0.8, n_sessions).astype(int), 1, large_session_size)
+    is_large = rng.random(n_sessions) < large_session_share
+    candidates[is_large] = rng.integers(large_session_size, 2 * large_session_size, is_large.sum())
+
+    session_ids = np.repeat(np.arange(n_sessions), candidates)
+    rows = len(session_ids)
+    sessions = pl.DataFrame({
+        "session_id": session_ids,
+        "user_id_hashed": _power_law_ids(rng, sizes["users"], n_sessions, user_alpha)[session_ids],
+        "search_term_normalized": _power_law_ids(rng, sizes["terms"], n_sessions, term_alpha)[session_ids],
+        "ts_hour": rng.integers(0, n_hours, n_sessions)[session_ids],
+        "content_id_hashed": _power_law_ids(rng, sizes["contents"], rows, content_alpha)
+    }).unique(subset=["session_id", "content_id_hashed"], keep="first", maintain_order=True)
+
+    if with_targets:
+        clicked = rng.random(len(sessions)) < 0.05
+        sessions = sessions.with_columns(
+            pl.Series("clicked", clicked.astype(np.int8)),
+            pl.Series("added_to_cart", (clicked & (rng.random(len(sessions)) < 0.2)).astype(np.int8)),
+            pl.Series("added_to_fav", (clicked & (rng.random(len(sessions)) < 0.1)).astype(np.int8)),
+            pl.Series("ordered", (clicked & (rng.random(len(sessions)) < 0.05)).astype(np.int8))
+        )
+
+    return sessions.with_columns(
+        _hashed("session_id", "s" if with_targets else "t"),
+        _hashed("user_id_hashed", "u"),
+        _hashed("search_term_normalized", "term "),
+        _hashed("content_id_hashed", "c"),
+        _hours("ts_hour", start)
+    )
+
+
+def generate_synthetic_data(
+    path: str,
+    scale: float = 1.0,
+    user_alpha: float = 1.1,
+    content_alpha: float = 1.0,
+    term_alpha: float = 1.2,
+    large_session_share: float = 0.05,
+    large_session_size: int = 1_200,
+    seed: int = 42
+) -> dict[str, str]:
+    """
+    Notebook'un okuduğu tüm parquet dosyalarını aynı isim ve şemalarla path altında sentetik olarak üretir.
+
+    User, content ve terimler power-law (alpha) dağılımıyla seçilir; alpha büyüdükçe ağır kullanıcı ve popüler
+    content yoğunluğu artar. Tablo büyüklükleri BASE_SIZES * scale'dir. Üretilen dosya yollarını döndürür.
+    """
+    rng = np.random.default_rng(seed)
+    sizes = {name: max(1, int(size * scale)) for name, size in BASE_SIZES.items()}
+    n_users, n_contents, n_terms = sizes["users"], sizes["contents"], sizes["terms"]
+
+    user_key = {"user_id_hashed": (n_users, user_alpha, "u")}
+    content_key = {"content_id_hashed": (n_contents, content_alpha, "c")}
+    term_key = {"search_term_normalized": (n_terms, term_alpha, "term ")}
+
+    tables = {
+        "train_sessions": _sessions(
+            rng, sizes["train_sessions"], sizes, TRAIN_START, 3 * 24, user_alpha, content_alpha, term_alpha,
+            large_session_share, large_session_size, with_targets=True
+        ),
+        "test_sessions": _sessions(
+            rng, sizes["test_sessions"], sizes, TEST_START, 24, user_alpha, content_alpha, term_alpha,
+            large_session_share, large_session_size, with_targets=False
+        ),
+        "user/sitewide_log": _log(rng, sizes["user/sitewide_log"], user_key, "ts_hour", SITEWIDE_COLS),
+        "user/search_log": _log(rng, sizes["user/search_log"], user_key, "ts_hour", SEARCH_COLS),
+        "user/fashion_sitewide_log": _log(rng, sizes["user/fashion_sitewide_log"], {**user_key, **content_key}, "ts_hour", SITEWIDE_COLS),
+        "user/fashion_search_log": _log(rng, sizes["user/fashion_search_log"], {**user_key, **content_key}, "ts_hour", SEARCH_COLS),
+        "user/top_terms_log": _log(rng, sizes["user/top_terms_log"], {**user_key, **term_key}, "ts_hour", SEARCH_COLS),
+        "term/search_log": _log(rng, sizes["term/search_log"], term_key, "ts_hour", SEARCH_COLS),
+        "content/sitewide_log": _log(rng, sizes["content/sitewide_log"], content_key, "date", SITEWIDE_COLS, truncate="1d"),
+        "content/search_log": _log(rng, sizes["content/search_log"], content_key, "date", SEARCH_COLS, truncate="1d"),
+        "content/top_terms_log": _log(rng, sizes["content/top_terms_log"], {**content_key, **term_key}, "date", SEARCH_COLS, truncate="1d")
+    }
+
+    # content price/rate/review geçmişi
+    n_price = sizes["content/price_rate_review_data"]
+    original_price = np.round(rng.lognormal(5, 1, n_price), 2)
+    selling_price = np.round(original_price * rng.uniform(0.6, 1.0, n_price), 2)
+    review_count = rng.poisson(rng.gamma(0.5, 40, n_price))
+    rate_count = review_count + rng.poisson(5, n_price)
+    tables["content/price_rate_review_data"] = pl.DataFrame({
+        "content_id_hashed": _power_law_ids(rng, n_contents, n_price, content_alpha),
+        "update_date": rng.integers(0, LOG_HOURS, n_price),
+        "original_price": original_price,
+        "selling_price": selling_price,
+        "discounted_price": np.round(selling_price * rng.uniform(0.8, 1.0, n_price), 2),
+        "content_review_count": review_count,
+        "content_review_wth_media_count": rng.binomial(review_count, 0.1),
+        "content_rate_count": rate_count,
+        "content_rate_avg": np.where(rate_count > 0, np.round(rng.uniform(1, 5, n_price), 2), np.nan)
+    }).with_columns(
+        _hashed("content_id_hashed", "c"), _hours("update_date", LOG_START, "1d"), pl.col("content_rate_avg").fill_nan(None)
+    ).unique(subset=["content_id_hashed", "update_date"], keep="first").sort(["content_id_hashed", "update_date"])
+
+    # content metadata (leaf -> level2 -> level1 hiyerarşisi)
+    n_leaf = max(10, n_contents // 200)
+    leaf = rng.integers(0, n_leaf, n_contents)
+    tables["content/metadata"] = pl.DataFrame({
+        "content_id_hashed": np.arange(n_contents),
+        "level1_category_name": [f"level1 {i % 8}" for i in leaf],
+        "level2_category_name": [f"level2 {i % 80}" for i in leaf],
+        "leaf_category_name": [f"leaf {i}" for i in leaf],
+        "attribute_type_count": rng.integers(0, 20, n_contents),
+        "total_attribute_option_count": rng.integers(0, 60, n_contents),
+        "merchant_count": rng.integers(1, 30, n_contents),
+        "filterable_label_count": rng.integers(0, 15, n_contents),
+        "content_creation_date": rng.integers(-365 * 24, LOG_HOURS, n_contents),
+        "cv_tags": [None if i % 10 == 0 else f"tag{i % 97},tag{i % 89},tag{i % 83}" for i in range(n_contents)]
+    }).with_columns(
+        _hashed("content_id_hashed", "c"), _hours("content_creation_date", LOG_START, "1d")
+    )
+
+    # user metadata
+    birth_year = rng.integers(1950, 2008, n_users).astype(float)
+    birth_year[rng.random(n_users) < 0.1] = np.nan
+    tables["user/metadata"] = pl.DataFrame({
+        "user_id_hashed": np.arange(n_users),
+        "user_gender": rng.choice(["F", "M", "U"], n_users),
+        "user_birth_year": birth_year,
+        "user_tenure_in_days": rng.integers(0, 3_000, n_users)
+    }).with_columns(_hashed("user_id_hashed", "u"), pl.col("user_birth_year").fill_nan(None))
+
+    files = {}
+    for name, table in tables.items():
+        files[name] = os.path.join(path, f"{name}.parquet")
+        os.makedirs(os.path.dirname(files[name]), exist_ok=True)
+        table.write_parquet(files[name])
+
+    return files
@@ -0,0 +1,28 @@
+import polars as pl
+
+
+ROW_INDEX = "__row_index"
+
+
+def add_row_index(df: pl.DataFrame) -> tuple[pl.DataFrame, list[str]]:
+    """
+    aligned=True modunda helper'ın başında çağrılır; df'in orijinal kolonlarını ve satır sırasını saklar.
+    """
+    return df.with_row_index(ROW_INDEX), df.collect_schema().names()
+
+
+def select_aligned(df: pl.DataFrame, input_cols: list[str]) -> pl.DataFrame:
+    """
+    Helper'ın yeni ürettiği kolonları çağıranın orijinal satır sırasında döndürür.
+    """
+    return df.sort(ROW_INDEX).select(pl.exclude(input_cols + [ROW_INDEX]))
+
+
+def select_required(df: pl.DataFrame, input_cols: list[str], required_columns: set[str] = None) -> pl.DataFrame:
+    """
+    required_columns verilirse helper'ın yeni kolonlarından sadece istenenleri tutar; df'in orijinal kolonlarına
+    dokunmaz.
+    """
+    if required_columns is None:
+        return df
+    return df.select([col for col in df.collect_schema().names() if col in input_cols or col == ROW_INDEX or col in required_columns])
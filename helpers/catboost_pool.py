@@ -0,0 +1,101 @@
+import json
+import os
+
+import polars as pl
+from catboost import FeaturesData, Pool
+
+
+def build_pool(
+    df: pl.DataFrame,
+    features: list[str],
+    cat_features: list[str] = [],
+    label: pl.Expr | str = None,
+    group_col: str = None,
+    cat_fill: str = "unknown"
+) -> Pool:
+    """
+    polars tablosundan pandas'a çevirmeden CatBoost Pool kurar: sayısal feature'lar tek bir float32 matrisine,
+    kategorik feature'lar (null'lar cat_fill ile) string matrisine alınır (FeaturesData).
+
+    Pool'daki kolon sırası önce sayısal sonra kategorik feature'lardır; model feature isimleriyle eşleştiği için
+    tahmin de build_pool ile kurulan Pool üzerinden yapılmalıdır. group_col verilirse df group_col'a göre sıralı
+    (her grup ardışık) olmalıdır.
+    """
+    if isinstance(df, pl.LazyFrame):
+        df = df.collect()
+
+    # 1 - group'ların ardışık olduğunun kontrolü
+    if group_col is not None:
+        n_runs, n_groups = df.select((pl.col(group_col).rle_id().max() + 1).alias("runs"), pl.col(group_col).n_unique().alias("groups")).row(0)
+        if n_runs != n_groups:
+            raise ValueError(f"`{group_col}` ardışık değil; df önce `{group_col}` ile sıralanmalıdır.")
+
+    # 2 - sayısal ve kategorik matrisler
+    num_features = [col for col in features if col not in cat_features]
+    cat_features = [col for col in features if col in cat_features]
+    data = FeaturesData(
+        num_feature_data=df.select(pl.col(num_features).cast(pl.Float32)).to_numpy(order="c"),
+        cat_feature_data=df.select(pl.col(cat_features).cast(pl.String).fill_null(cat_fill)).to_numpy() if cat_features else None,
+        num_feature_names=num_features,
+        cat_feature_names=cat_features if cat_features else None
+    )
+
+    # 3 - label ve group_id
+    return Pool(
+        data=data,
+        label=df.select(label).to_series().to_numpy() if label is not None else None,
+        group_id=df[group_col].to_numpy() if group_col is not None else None
+    )
+
+
+def load_or_build_quantized_pool(
+    path: str,
+    df: pl.DataFrame,
+    features: list[str],
+    cat_features: list[str] = [],
+    label: pl.Expr | str = None,
+    group_col: str = None,
+    cat_fill: str = "unknown",
+    quantization_params: dict = {}
+) -> Pool:
+    """
+    Eğitim Pool'unu quantize edip path'e kaydeder; aynı veri, feature listesi ve quantization parametreleriyle
+    tekrar çağrıldığında Pool yeniden kurulup quantize edilmek yerine diskten okunur. Böylece farklı model
+    parametreleriyle (learning_rate, depth, iterations ...) yapılan eğitimler aynı quantize Pool'u kullanır.
+
+    quantization_params (border_count, feature_border_type, nan_mode ...) modelin parametreleriyle aynı olmalıdır.
+    Veri değişikliği, seçilen kolonların ve label'ın satır hash'lerinden üretilen parmak izi ile yakalanır.
+    """
+    if isinstance(df, pl.LazyFrame):
+        df = df.collect()
+
+    # 1 - cache anahtarı
+    label_expr = pl.lit(None) if label is None else pl.col(label) if isinstance(label, str) else label
+    selected = df.select(pl.col(features), *([pl.col(group_col)] if group_col is not None else []), label_expr.alias("_label"))
+    meta = {
+        "features": features,
+        "cat_features": cat_features,
+        "label": str(label),
+        "group_col": group_col,
+        "cat_fill": cat_fill,
+        "quantization_params": quantization_params,
+        "rows": selected.height,
+        "fingerprint": str(selected.hash_rows(seed=0).sum())
+    }
+
+    # 2 - kayıtlı Pool aynı anahtarla yazılmışsa diskten okuma
+    meta_path = f"{path}.json"
+    if os.path.exists(path) and os.path.exists(meta_path):
+        with open(meta_path) as f:
+            if json.load(f) == meta:
+                return Pool(data=f"quantized://{path}")
+
+    # 3 - Pool'un kurulması, quantize edilmesi ve kaydedilmesi
+    pool = build_pool(df, features, cat_features, label, group_col, cat_fill)
+    pool.quantize(**quantization_params)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    pool.save(path)
+    with open(meta_path, "w") as f:
+        json.dump(meta, f, indent=2)
+
+    return pool
@@ -0,0 +1,107 @@
+import re
+import warnings
+
+import polars as pl
+
+
+class PrecisionLossWarning(UserWarning):
+    pass
+
+
+# Helper'ların ürettiği kolon ailelerine göre hedef tipler; ilk eşleşen ve kaynakla aynı türdeki (int/float) kural uygulanır.
+# Sadece daha dar tipe iniş yapılır; id, target ve tarih kolonları sayısal aile kurallarına girmedikçe dokunulmaz.
+FEATURE_DTYPE_POLICY = [
+    # session içi rank'ler (rank_{session}_{col}, *_rank kolonları)
+    (r"^rank_|_rank$", pl.UInt16),
+    # session / aktif session / aday sayıları
+    (r"_session_count$|_candidate_count$", pl.UInt32),
+    # expanding ve rolling sum/max/min, step bazlı rolling sum ve son değer kolonları (sayımlar)
+    (r"_(sum|max)$|_rolling_(sum|min|max)_|roll_step_sum_", pl.Int32),
+    # kalan tam sayı feature'lar
+    (r".", pl.Int32),
+    # avg, std, ratio, decay skorları, fiyat istatistikleri ve kalan tüm ondalıklı feature'lar
+    (r".", pl.Float32)
+]
+
+
+_BIT_WIDTHS = {
+    pl.Int8: 8, pl.Int16: 16, pl.Int32: 32, pl.Int64: 64,
+    pl.UInt8: 8, pl.UInt16: 16, pl.UInt32: 32, pl.UInt64: 64,
+    pl.Float32: 32, pl.Float64: 64
+}
+
+
+def _target_dtype(col: str, dtype: pl.DataType, policy: list[tuple[str, pl.DataType]]) -> pl.DataType:
+    for pattern, target in policy:
+        if not re.search(pattern, col):
+            continue
+        if dtype.is_integer() and target.is_integer() or dtype.is_float() and target.is_float():
+            return target
+    return None
+
+
+def compact_dtypes(
+    df: pl.DataFrame,
+    policy: list[tuple[str, pl.DataType]] = FEATURE_DTYPE_POLICY,
+    tolerance: float = 1e-6,
+    exclude: list[str] = []
+) -> tuple[pl.DataFrame, pl.DataFrame]:
+    """
+    Sayısal kolonları policy'deki kolon ailesi tiplerine indirir ve (df, rapor) döndürür.
+
+    Tam sayı kolonları sadece değer aralığı hedef tipe sığıyorsa, ondalıklı kolonlar sadece en büyük göreli hata
+    tolerance'ı aşmıyorsa indirilir; aşan kolonlar orijinal tipinde bırakılır ve PrecisionLossWarning verilir.
+    Rapor kolon bazında kaynak/hedef tip, önceki/sonraki byte ve en büyük göreli hatayı içerir.
+    """
+    if isinstance(df, pl.LazyFrame):
+        df = df.collect()
+
+    # 1 - policy'ye göre aday kolonlar (sadece daha dar tipe iniş)
+    candidates = {}
+    for col, dtype in df.schema.items():
+        if col in exclude or not dtype.is_numeric():
+            continue
+        target = _target_dtype(col, dtype, policy)
+        if target is not None and _BIT_WIDTHS.get(target, 64) < _BIT_WIDTHS.get(dtype, 64):
+            candidates[col] = target
+
+    # 2 - tek projeksiyonda dönüştürme ve hata ölçümü
+    def _relative_error(col: str, target: pl.DataType) -> pl.Expr:
+        original = pl.col(col).cast(pl.Float64)
+        casted = pl.col(col).cast(target, strict=False).cast(pl.Float64)
+        error = ((casted - original).abs() / pl.max_horizontal(original.abs(), pl.lit(1e-30))).fill_nan(None)
+        # aralık dışı tam sayılar null olur; null sayısı artarsa sonsuz hata
+        overflow = casted.null_count() > original.null_count()
+        return pl.when(overflow).then(float("inf")).otherwise(error.max().fill_null(0.0)).alias(col)
+
+    errors = df.select(_relative_error(col, target) for col, target in candidates.items()).row(0, named=True) if candidates else {}
+
+    # 3 - tolerans içindeki kolonların indirilmesi ve rapor
+    applied = {col: target for col, target in candidates.items() if errors[col] <= tolerance}
+    compacted = df.with_columns(pl.col(col).cast(target) for col, target in applied.items())
+
+    report = pl.DataFrame([
+        {
+            "column": col,
+            "source_dtype": str(df.schema[col]),
+            "target_dtype": str(target),
+            "bytes_before": df[col].estimated_size(),
+            "bytes_after": compacted[col].estimated_size(),
+            "max_relative_error": errors[col],
+            "applied": col in applied
+        }
+        for col, target in candidates.items()
+    ], schema={
+        "column": pl.String, "source_dtype": pl.String, "target_dtype": pl.String, "bytes_before": pl.Int64,
+        "bytes_after": pl.Int64, "max_relative_error": pl.Float64, "applied": pl.Boolean
+    })
+
+    lossy = [col for col in candidates if col not in applied]
+    if lossy:
+        warnings.warn(
+            f"{len(lossy)} kolon tolerans ({tolerance}) aşıldığı için orijinal tipinde bırakıldı: {lossy[:10]}",
+            PrecisionLossWarning,
+            stacklevel=2
+        )
+
+    return compacted, report
@@ -1,40 +1,114 @@
-import polars as pl
+import json
+import os
+import shutil
 
+import polars as pl
 
-def add_content_price_history(
-    df: pl.DataFrame,
+from helpers.alignment import add_row_index, select_aligned, select_required
+from helpers.profiling import record_stage
+
+
+_RENORMALIZE_COLUMNS = ["original_price","selling_price","discounted_price","content_review_count","content_review_wth_media_count","content_rate_count"]
+_PRICE_COLUMNS = ["original_price","selling_price","discounted_price"]
+_LOW_RANK_COLUMNS = [f"{col}_log" for col in _PRICE_COLUMNS]
+_HIGH_RANK_COLUMNS = [
+    "discount_rate","selling_rate","content_rate_avg_bayesian","content_review_count_norm","content_review_wth_media_count_norm",
+    "wilson_score_rate_to_review","wilson_score_review_to_media"
+]
+_TENURE_COLUMNS = ["content_tenure_hours","update_tenure_hours","update_to_content_tenure_ratio"]
+_SNAPSHOT_META = "_snapshot.json"
+
+
+def _content_price_plan(categories: list[str], required_columns: set[str] = None) -> dict:
+    """
+    required_columns'a göre hesaplanacak kategori boyutlarını, kategori istatistiklerini, smoothed kolonları,
+    rank'leri ve global istatistikleri döndürür; required_columns verilmezse hepsi hesaplanır.
+    """
+    ranks = [(col, cat_col) for col in _LOW_RANK_COLUMNS + _HIGH_RANK_COLUMNS for cat_col in categories]
+    smoothed = [(col, cat_col) for col in _PRICE_COLUMNS for cat_col in categories]
+    category_stats = list(categories)
+    sizes = list(categories)
+    if required_columns is not None:
+        ranks = [(col, cat_col) for col, cat_col in ranks if f"rank_{cat_col}_{col}" in required_columns]
+        smoothed = [(col, cat_col) for col, cat_col in smoothed if {f"smoothed_{cat_col}_{col}_mean", f"smoothed_{cat_col}_{col}_std"} & required_columns]
+        category_stats = [
+            cat_col for cat_col in categories
+            if any(cat_col == smoothed_cat for _, smoothed_cat in smoothed)
+            or any(f"{cat_col}_{col}_log_{stat}" in required_columns for col in _PRICE_COLUMNS for stat in ["mean", "std"])
+        ]
+        sizes = [cat_col for cat_col in categories if cat_col in category_stats or f"{cat_col}_size" in required_columns]
+
+    stats = ["min_review_count"]
+    if required_columns is None or "content_rate_avg_bayesian" in required_columns or any(col == "content_rate_avg_bayesian" for col, _ in ranks):
+        stats.append("rate_avg_mean")
+    stats += [f"{col}_log_{stat}" for col in dict.fromkeys(col for col, _ in smoothed) for stat in ["mean", "std"]]
+
+    return {"ranks": ranks, "smoothed": smoothed, "category_stats": category_stats, "sizes": sizes, "stats": stats}
+
+
+def _content_price_stats(content_price: pl.DataFrame, stat_names: list[str] = None) -> pl.LazyFrame:
+    """
+    content_price zenginleştirmesinde kullanılan global istatistikleri tek geçişte, tek satırlık bir LazyFrame
+    olarak hesaplar; stat_names verilirse sadece bunları hesaplar. Log fiyatlar min_review_count'a bağlı olduğu
+    için min de aynı select içinde ifade olarak kullanılır, ayrı bir scalar collect yapılmaz.
+    """
+    min_review_count = pl.col("content_review_count").filter(pl.col("content_review_count")>0).min()
+    stats = [min_review_count.alias("min_review_count")]
+    if stat_names is None or "rate_avg_mean" in stat_names:
+        stats.append(pl.col("content_rate_avg").mean().alias("rate_avg_mean"))
+    for col in _PRICE_COLUMNS:
+        if stat_names is not None and f"{col}_log_mean" not in stat_names:
+            continue
+        log_col = ((pl.col(col)/min_review_count) + 1).log()
+        stats += [log_col.mean().alias(f"{col}_log_mean"), log_col.std().alias(f"{col}_log_std")]
+    return content_price.lazy().select(stats)
+
+
+def _enrich_content_price(
     content_price: pl.DataFrame,
     content_metadata: pl.DataFrame,
-    content_col: str = "content_id_hashed",
-    left_time_col: str = "date",
-    right_time_col: str = "update_date",
-    categories: list[str] = ["level1_category_name", "level2_category_name", "leaf_category_name"],
-    bayesian_m: int = 30,
-    psuedo_alpha: int = 1,
-    psuedo_beta: int = 1,
-    wilson_z: float = 1.96,
-    exact_match: bool = False
+    stats: pl.LazyFrame | dict[str, float],
+    content_col: str,
+    right_time_col: str,
+    categories: list[str],
+    bayesian_m: int,
+    psuedo_alpha: int,
+    psuedo_beta: int,
+    wilson_z: float,
+    plan: dict = None
 ) -> pl.DataFrame:
-
-    _min_value = content_price.filter(pl.col("content_review_count")>0).select(pl.col("content_review_count").min()).collect().item()
-    C = content_price.select(pl.col("content_rate_avg").mean()).collect().item()
-    _renormalize_columns = ["original_price","selling_price","discounted_price","content_review_count","content_review_wth_media_count","content_rate_count"]
-    _price_columns = ["original_price","selling_price","discounted_price"]
-
-    df = df.sort([content_col,left_time_col])
-    content_price = content_price.sort([content_col,right_time_col])
+    """
+    content_price tablosuna metadata, fiyat, bayesian/wilson skorları, kategori istatistikleri ve kategori
+    içi rank kolonlarını ekler. Kategori bazlı kolonlar sadece aynı kategorideki satırlara bağlıdır.
+    plan (_content_price_plan) verilirse sadece plandaki kategori boyutu, kategori istatistiği, smoothed ve
+    rank kolonları hesaplanır.
+
+    stats, _content_price_stats'in tek satırlık LazyFrame'i (ya da snapshot'taki sabit değerler sözlüğü) olur ve
+    cross join ile plana eklenir; sonuç collect edilene kadar lazy kalır. Kategori boyutları ve kategori içi
+    momentler group_by + join yerine her biri tek projeksiyonda pencere ifadeleriyle hesaplanır.
+    """
+    if plan is None:
+        plan = _content_price_plan(categories)
+    if isinstance(stats, dict):
+        stats = pl.LazyFrame({name: [value] for name, value in stats.items()})
+
+    def _stat(name: str) -> pl.Expr:
+        return pl.col(f"_stat_{name}")
+
+    # 0 - global istatistiklerin plana eklenmesi
+    content_price = content_price.lazy().sort([content_col,right_time_col])
+    content_price = content_price.join(stats.select(pl.all().name.prefix("_stat_")), how="cross", maintain_order="left")
 
     # 1 - null degerlerin doldurulmasi
-    content_metadata = content_metadata.with_columns(pl.col("cv_tags").fill_null(""))
+    content_metadata = content_metadata.lazy().with_columns(pl.col("cv_tags").fill_null(""))
     content_metadata = content_metadata.fill_null(0)
 
     # 2 - category_sizes olusturulmasi
-    for group in categories:
-        category_sizes = content_metadata.group_by(group).agg(pl.count()).rename({"count": f"{group}_size"})
-        content_metadata = content_metadata.join(category_sizes, on=group, how="left")
+    content_metadata = content_metadata.with_columns(*[pl.len().over(group).alias(f"{group}_size") for group in plan["sizes"]])
 
     # 3 - category_metadata'nin content_price'a eklenmesi
-    content_price = content_price.join(content_metadata, on=content_col, how="left")
+    content_price = record_stage("add_content_price_history", "3 - metadata join", content_price.join(content_metadata, on=content_col, how="left"),
+                                 inputs=[content_price], join=True)
 
     # 4 - null categorylerin unknown ile doldurulmasi
     for cat_col in categories:
@@ -48,18 +122,19 @@ def add_content_price_history(
     )
 
     # 6 - price ve count'larin normal sayilara geri donusturulmesi
-    content_price = content_price.with_columns(*[(pl.col(col)/_min_value).alias(f"{col}_norm") for col in _renormalize_columns])
+    content_price = content_price.with_columns(*[(pl.col(col)/_stat("min_review_count")).alias(f"{col}_norm") for col in _RENORMALIZE_COLUMNS])
 
     # 7 - log price'larin olusturulmasi
-    content_price = content_price.with_columns(*[((pl.col(f"{col}_norm") + 1).log()).alias(f"{col}_log") for col in _price_columns])
+    content_price = content_price.with_columns(*[((pl.col(f"{col}_norm") + 1).log()).alias(f"{col}_log") for col in _PRICE_COLUMNS])
 
     # 8 - bayesian rate avg olusturulmasi
-    content_price = content_price.with_columns(
-        (
-            (pl.col("content_rate_count") * pl.col("content_rate_avg") + bayesian_m * C) /
-            (pl.col("content_rate_count") + bayesian_m)
-        ).alias("content_rate_avg_bayesian")
-    )
+    if "rate_avg_mean" in plan["stats"]:
+        content_price = content_price.with_columns(
+            (
+                (pl.col("content_rate_count") * pl.col("content_rate_avg") + bayesian_m * _stat("rate_avg_mean")) /
+                (pl.col("content_rate_count") + bayesian_m)
+            ).alias("content_rate_avg_bayesian")
+        )
 
     # 9 - smoothed ratio for counts
     content_price = content_price.with_columns(
@@ -99,50 +174,212 @@ def add_content_price_history(
     content_price = content_price.drop(["wilson_p_rate_to_review","wilson_p_review_to_media"])
 
     # 11 - category mean/std prices
-    for cat_col in categories:
+    content_price = content_price.with_columns(*[
+        expr.over(cat_col).fill_null(0)
+        for cat_col in plan["category_stats"]
+        for expr in [pl.col(f"{col}_log").mean().alias(f"{cat_col}_{col}_log_mean") for col in _PRICE_COLUMNS]
+        + [pl.col(f"{col}_log").std().alias(f"{cat_col}_{col}_log_std") for col in _PRICE_COLUMNS]
+    ])
+
+    for col, cat_col in plan["smoothed"]:
 
-        agg_df = content_price.group_by(cat_col).agg(
-            *[pl.col(f"{col}_log").mean().alias(f"{cat_col}_{col}_log_mean") for col in _price_columns],
-            *[pl.col(f"{col}_log").std().alias(f"{cat_col}_{col}_log_std") for col in _price_columns]
-        ).fill_null(0)
+        global_mean = _stat(f"{col}_log_mean")
+        global_std = _stat(f"{col}_log_std")
 
-        content_price = content_price.join(agg_df, on=cat_col, how="left")
+        n_col = f"{cat_col}_size"
 
-    for col in _price_columns:
+        content_price = content_price.with_columns(
+            (pl.col(f"{cat_col}_{col}_log_mean") * (pl.col(n_col)/(pl.col(n_col)+bayesian_m)) + global_mean * (pl.col(n_col)/(pl.col(n_col)+bayesian_m))).alias(f"smoothed_{cat_col}_{col}_mean"),
+            (pl.col(f"{cat_col}_{col}_log_std") * (pl.col(n_col)/(pl.col(n_col)+bayesian_m)) + global_std * (pl.col(n_col)/(pl.col(n_col)+bayesian_m))).alias(f"smoothed_{cat_col}_{col}_std")
+        )
 
-        global_mean = content_price.select(pl.col(f"{col}_log").mean()).collect().item()
-        global_std = content_price.select(pl.col(f"{col}_log").std()).collect().item()
+    content_price = content_price.drop([f"_stat_{name}" for name in stats.collect_schema().names()])
 
-        for cat_col in categories:
+    # 12 - rank features
+    for col, cat_col in plan["ranks"]:
+        rank_col = pl.col(col) if col in _LOW_RANK_COLUMNS else -pl.col(col)
+        content_price = content_price.with_columns(
+            rank_col.rank(method="min").over(partition_by=cat_col).alias(f"rank_{cat_col}_{col}")
+        )
 
-            n_col = f"{cat_col}_size"
+    return content_price
 
-            content_price = content_price.with_columns(
-                (pl.col(f"{cat_col}_{col}_log_mean") * (pl.col(n_col)/(pl.col(n_col)+bayesian_m)) + global_mean * (pl.col(n_col)/(pl.col(n_col)+bayesian_m))).alias(f"smoothed_{cat_col}_{col}_mean"),
-                (pl.col(f"{cat_col}_{col}_log_std") * (pl.col(n_col)/(pl.col(n_col)+bayesian_m)) + global_std * (pl.col(n_col)/(pl.col(n_col)+bayesian_m))).alias(f"smoothed_{cat_col}_{col}_std")
-            )
 
-    # 12 - rank features
-    low_rank_cols = [f"{col}_log" for col in _price_columns]
-    high_rank_cols = ["discount_rate","selling_rate","content_rate_avg_bayesian","content_review_count_norm","content_review_wth_media_count_norm"]
-    high_rank_cols += ["wilson_score_rate_to_review","wilson_score_review_to_media"]
-
-    for col in low_rank_cols:
-        for cat_col in categories:
-            content_price = content_price.with_columns(
-                pl.col(col).rank(method="min").over(partition_by=cat_col).alias(f"rank_{cat_col}_{col}")
-            )
+def _read_snapshot_meta(path: str) -> dict:
+    with open(os.path.join(path, _SNAPSHOT_META)) as f:
+        return json.load(f)
 
-    for col in high_rank_cols:
-        for cat_col in categories:
-            content_price = content_price.with_columns(
-                (-pl.col(col)).rank(method="min").over(partition_by=cat_col).alias(f"rank_{cat_col}_{col}")
-            )
 
-    # 13 - df'e ekleme
-    df = df.join_asof(content_price, left_on=left_time_col, right_on=right_time_col, by=content_col, strategy="backward", allow_exact_matches=exact_match)
-    
-    # 14 - date col'ların eklenmesi
+def _scan_snapshot(path: str, meta: dict) -> pl.LazyFrame:
+    return pl.scan_parquet(
+        os.path.join(path, "**", "*.parquet"),
+        hive_partitioning=True,
+        hive_schema={meta["params"]["categories"][0]: pl.String}
+    ).select(meta["columns"])
+
+
+def _price_fingerprint(content_price: pl.DataFrame, price_columns: list[str]) -> pl.LazyFrame:
+    """
+    Snapshot'ın hangi content_price verisinden yazıldığını ayırt etmek için satır sayısı ve satır hash'lerinin
+    toplamı (satır sırasından bağımsız).
+    """
+    return content_price.lazy().select(price_columns).select(
+        pl.len().alias("rows"),
+        pl.struct(pl.all()).hash(seed=0).sum().cast(pl.String).alias("hash_sum")
+    )
+
+
+def _stats_drift(stats: dict[str, float], reference: dict[str, float]) -> float:
+    """
+    Global istatistiklerin referans değerlere göre en büyük göreli farkı.
+    """
+    return max(
+        (abs(stats[name] - value) / max(abs(value), 1e-12) for name, value in reference.items() if value is not None and stats[name] is not None),
+        default=0.0
+    )
+
+
+def _write_snapshot_partitions(content_price: pl.DataFrame, path: str, partition_col: str) -> None:
+    """
+    content_price'ı partition_col bazında hive partition'larına yazar; yazılan partition'lar path'te varsa
+    üzerine yazılır, diğer partition'lara dokunulmaz.
+    """
+    staging_path = f"{path.rstrip(os.sep)}_staging"
+    shutil.rmtree(staging_path, ignore_errors=True)
+    content_price.write_parquet(staging_path, partition_by=partition_col)
+
+    os.makedirs(path, exist_ok=True)
+    for partition in os.listdir(staging_path):
+        shutil.rmtree(os.path.join(path, partition), ignore_errors=True)
+        shutil.move(os.path.join(staging_path, partition), os.path.join(path, partition))
+    shutil.rmtree(staging_path)
+
+
+def write_content_price_snapshot(
+    content_price: pl.DataFrame,
+    content_metadata: pl.DataFrame,
+    path: str,
+    content_col: str = "content_id_hashed",
+    right_time_col: str = "update_date",
+    categories: list[str] = ["level1_category_name", "level2_category_name", "leaf_category_name"],
+    bayesian_m: int = 30,
+    psuedo_alpha: int = 1,
+    psuedo_beta: int = 1,
+    wilson_z: float = 1.96
+) -> None:
+    """
+    Zenginleştirilmiş content_price tablosunu categories[0] bazında partition'lanmış parquet snapshot olarak
+    path'e yazar. Global istatistikler, parametreler ve girdinin parmak izi (satır sayısı, satır hash'lerinin
+    toplamı) path/_snapshot.json'a kaydedilir.
+
+    Snapshot önce geçici bir klasöre yazılıp path ile yer değiştirilir. path var olup bir snapshot değilse
+    (_snapshot.json yoksa ve boş değilse) hata verir, klasör silinmez.
+    """
+    path = path.rstrip(os.sep)
+    if os.path.isdir(path) and os.listdir(path) and not os.path.exists(os.path.join(path, _SNAPSHOT_META)):
+        raise ValueError(f"`{path}` bir content price snapshot'ı değil ({_SNAPSHOT_META} yok); üzerine yazılmadı.")
+
+    params = dict(
+        content_col=content_col, right_time_col=right_time_col, categories=categories, bayesian_m=bayesian_m,
+        psuedo_alpha=psuedo_alpha, psuedo_beta=psuedo_beta, wilson_z=wilson_z
+    )
+    price_columns = content_price.collect_schema().names()
+    stats = _content_price_stats(content_price)
+    stats, fingerprint, snapshot = pl.collect_all([
+        stats, _price_fingerprint(content_price, price_columns), _enrich_content_price(content_price, content_metadata, stats, **params)
+    ])
+
+    # geçici klasöre yazılıp eski snapshot ile yer değiştirilmesi
+    staging_path = f"{path}.{_SNAPSHOT_META}.staging"
+    shutil.rmtree(staging_path, ignore_errors=True)
+    snapshot.write_parquet(staging_path, partition_by=categories[0])
+    with open(os.path.join(staging_path, _SNAPSHOT_META), "w") as f:
+        json.dump({
+            "stats": stats.row(0, named=True),
+            "params": params,
+            "columns": snapshot.columns,
+            "price_columns": price_columns,
+            "fingerprint": fingerprint.row(0, named=True),
+            "stats_drift": 0.0
+        }, f)
+
+    if os.path.exists(path):
+        old_path = f"{path}.{_SNAPSHOT_META}.old"
+        shutil.rmtree(old_path, ignore_errors=True)
+        os.rename(path, old_path)
+        os.rename(staging_path, path)
+        shutil.rmtree(old_path)
+    else:
+        os.rename(staging_path, path)
+
+
+def update_content_price_snapshot(
+    content_price_updates: pl.DataFrame,
+    content_metadata: pl.DataFrame,
+    path: str,
+    stats_tolerance: float = 1e-3
+) -> None:
+    """
+    Yeni gelen price update'lerini snapshot'a ekler. Sadece update'lerin dokunduğu kategorilerin (ve bu
+    kategorilerle partition paylaşan kategorilerin) satırları yeniden hesaplanır ve ilgili partition'lar
+    yeniden yazılır.
+
+    Global istatistikler (log fiyat ortalama/std, rate ortalaması) tüm satırlara girdiği için güncellenmiş
+    tablo üzerinden lazy olarak yeniden hesaplanır. Snapshot'ın yazıldığı istatistiklerden göreli farkı
+    stats_tolerance'ı aşarsa snapshot tüm tabloyla yeniden yazılır; aşmazsa yazılı istatistikler korunur ve fark
+    _snapshot.json'da stats_drift olarak saklanır (stats_tolerance=0 ile her değişiklikte yeniden yazılır).
+    """
+    meta = _read_snapshot_meta(path)
+    params = meta["params"]
+    content_col, right_time_col, categories = params["content_col"], params["right_time_col"], params["categories"]
+    snapshot = _scan_snapshot(path, meta)
+    updates = content_price_updates.lazy().select(meta["price_columns"])
+
+    # 0 - güncellenmiş tablonun global istatistikleri; fark toleransı aşarsa tam yeniden yazım
+    full_price = pl.concat([snapshot.select(meta["price_columns"]), updates], how="vertical_relaxed").unique(
+        subset=[content_col, right_time_col], keep="last", maintain_order=True
+    )
+    stats = _content_price_stats(full_price).collect().row(0, named=True)
+    stats_drift = _stats_drift(stats, meta["stats"])
+    if stats_drift > stats_tolerance:
+        write_content_price_snapshot(full_price.collect(), content_metadata, path, **params)
+        return
+
+    # 1 - update'lerin kategorileri
+    update_categories = updates.select(content_col).unique().join(
+        content_metadata.lazy().select([content_col] + categories), on=content_col, how="left"
+    ).select([pl.col(cat_col).fill_null("unknown") for cat_col in categories])
+
+    # 2 - etkilenen kategorilerin, partition'ları tamamlanacak şekilde genişletilmesi
+    category_pairs = snapshot.select(categories).unique().collect()
+    affected = update_categories.unique().collect()
+    affected = {cat_col: set(affected[cat_col]) for cat_col in categories}
+    while True:
+        rows = category_pairs.filter(pl.any_horizontal([pl.col(cat_col).is_in(list(affected[cat_col])) for cat_col in categories]))
+        expanded = {cat_col: affected[cat_col] | set(rows[cat_col]) for cat_col in categories}
+        if expanded == affected:
+            break
+        affected = expanded
+
+    # 3 - etkilenen satırların yeniden hesaplanması ve partition'ların yeniden yazılması
+    history = snapshot.filter(pl.col(categories[0]).is_in(list(affected[categories[0]]))).select(meta["price_columns"])
+    content_price = pl.concat([history, updates], how="vertical_relaxed").unique(
+        subset=[content_col, right_time_col], keep="last", maintain_order=True
+    )
+    recomputed = _enrich_content_price(content_price, content_metadata, meta["stats"], **params).collect()
+    _write_snapshot_partitions(recomputed.select(meta["columns"]), path, categories[0])
+
+    # 4 - parmak izinin ve istatistik farkının güncellenmiş snapshot'a göre yenilenmesi
+    meta["fingerprint"] = _price_fingerprint(_scan_snapshot(path, meta), meta["price_columns"]).collect().row(0, named=True)
+    meta["stats_drift"] = stats_drift
+    with open(os.path.join(path, _SNAPSHOT_META), "w") as f:
+        json.dump(meta, f)
+
+
+def _add_tenure_columns(df: pl.DataFrame, right_time_col: str) -> pl.DataFrame:
+    """
+    As-of join sonrası content ve son update yaşını (saat) ve oranlarını ekler.
+    """
     df = df.with_columns(
         (pl.col("ts_hour").cast(pl.Datetime("ms")) - pl.col("content_creation_date").cast(pl.Datetime("ms"))).dt.total_hours().alias("content_tenure_hours"),
         (pl.col("ts_hour").cast(pl.Datetime("ms")) - pl.col(right_time_col).cast(pl.Datetime("ms"))).dt.total_hours().alias("update_tenure_hours")
@@ -164,4 +401,86 @@ def add_content_price_history(
         pl.col("update_to_content_tenure_ratio").fill_null(0).alias("update_to_content_tenure_ratio")
     )
 
-    return df
\ No newline at end of file
+    return df
+
+
+def add_content_price_history(
+    df: pl.DataFrame,
+    content_price: pl.DataFrame,
+    content_metadata: pl.DataFrame,
+    content_col: str = "content_id_hashed",
+    left_time_col: str = "date",
+    right_time_col: str = "update_date",
+    categories: list[str] = ["level1_category_name", "level2_category_name", "leaf_category_name"],
+    bayesian_m: int = 30,
+    psuedo_alpha: int = 1,
+    psuedo_beta: int = 1,
+    wilson_z: float = 1.96,
+    exact_match: bool = False,
+    aligned: bool = False,
+    snapshot_path: str = None,
+    required_columns: set[str] = None
+) -> pl.DataFrame:
+    """
+    content_price tablosunu zenginleştirip session'lara content bazında backward as-of join ile ekler.
+
+    snapshot_path verilirse zenginleştirilmiş tablo bir kez write_content_price_snapshot ile yazılır ve
+    sonraki çağrılarda sadece okunup as-of join yapılır. content_price'ın parmak izi (satır sayısı, satır
+    hash'lerinin toplamı) snapshot'ınkinden farklıysa snapshot yeniden yazılır. update_content_price_snapshot ile
+    güncellenen snapshot'ın global istatistikleri tam hesaplamadan en fazla stats_drift kadar farklıdır.
+    content_price None ise mevcut snapshot kontrol edilmeden kullanılır.
+    required_columns verilirse sadece bu kolonların bağlı olduğu global istatistikler, kategori boyutu/istatistik
+    join'leri ve kategori içi rank'ler hesaplanır; join'e sadece istenen kolonlar girer. Snapshot her zaman
+    tüm kolonlarla yazılır, okunurken istenen kolonlar seçilir.
+    """
+    params = dict(
+        content_col=content_col, right_time_col=right_time_col, categories=categories, bayesian_m=bayesian_m,
+        psuedo_alpha=psuedo_alpha, psuedo_beta=psuedo_beta, wilson_z=wilson_z
+    )
+    input_cols = df.collect_schema().names()
+    tenure = required_columns is None or any(col in required_columns for col in _TENURE_COLUMNS)
+
+    if aligned:
+        df, input_cols = add_row_index(df)
+
+    df = df.sort([content_col,left_time_col])
+
+    # 1-12 - zenginleştirilmiş content_price (snapshot ya da yeniden hesaplama)
+    if snapshot_path is None:
+        plan = _content_price_plan(categories, required_columns)
+        stats = _content_price_stats(content_price, plan["stats"])
+        content_price = record_stage("add_content_price_history", "1-12 - enrich", _enrich_content_price(content_price, content_metadata, stats, **params, plan=plan))
+    else:
+        stale = True
+        if os.path.exists(os.path.join(snapshot_path, _SNAPSHOT_META)):
+            meta = _read_snapshot_meta(snapshot_path)
+            if meta["params"] != params:
+                raise ValueError(f"`{snapshot_path}` snapshot'ı farklı parametrelerle yazılmış: {meta['params']}")
+            stale = content_price is not None and meta.get("fingerprint") != _price_fingerprint(content_price, meta["price_columns"]).collect().row(0, named=True)
+        if stale:
+            write_content_price_snapshot(content_price, content_metadata, snapshot_path, **params)
+        meta = _read_snapshot_meta(snapshot_path)
+        content_price = _scan_snapshot(snapshot_path, meta).sort([content_col,right_time_col])
+
+    # sadece istenen kolonlar (ve tenure kolonları için content_creation_date) join'e girer
+    if required_columns is not None:
+        join_cols = [content_col, right_time_col] + (["content_creation_date"] if tenure else [])
+        content_price = content_price.select([col for col in content_price.collect_schema().names() if col in join_cols or col in required_columns])
+    if isinstance(df, pl.DataFrame):
+        content_price = content_price.collect()
+
+    # 13 - df'e ekleme
+    df = record_stage("add_content_price_history", "13 - as-of join", df.join_asof(
+        content_price, left_on=left_time_col, right_on=right_time_col, by=content_col, strategy="backward", allow_exact_matches=exact_match
+    ), inputs=[df, content_price], join=True)
+    
+    # 14 - date col'ların eklenmesi
+    if tenure:
+        df = _add_tenure_columns(df, right_time_col)
+    df = select_required(df, input_cols, required_columns)
+
+    if aligned:
+        df = select_aligned(df, input_cols)
+
+    return df
+
@@ -1,6 +1,173 @@
+import heapq
+import json
+import os
+
 import polars as pl
 import numpy as np
 
+from helpers.alignment import add_row_index, select_aligned
+from helpers.profiling import record_stage
+
+
+def build_interaction_step_index(
+    frames: list[pl.DataFrame],
+    user_col: str = "user_id_hashed",
+    time_col: str = "ts_hour",
+    path: str = None,
+    rebuild: bool = False
+) -> pl.DataFrame:
+    """
+    Verilen log ve session tablolarının birleşimindeki her (user, time) çiftine user bazında artan
+    interaction_step numarası verir ve (user, time) sıralı kompakt bir tablo döndürür.
+
+    path verilirse tablo parquet olarak yazılır ve girdilerin parmak izi (her frame için satır sayısı ve (user, time)
+    satır hash'lerinin toplamı) {path}.json'a kaydedilir. Dosya varsa ve parmak izi aynıysa yeniden hesaplanmadan
+    okunur; aynı (user, time) çiftleri aynı step'leri verdiği için okunan tablo frame'leri kapsar. Log veya
+    session'lar değiştiyse (ya da rebuild=True ise) tablo yeniden kurulur. Decay helper'larına step_index olarak
+    verildiğinde step tablosu her çağrıda yeniden kurulmaz; index helper'a verilen interactions_df ve train_df'teki
+    tüm (user, time) çiftlerini kapsamalıdır (helper'larda check_step_index=True ile kontrol edilir).
+    """
+    lazy = isinstance(frames[0], pl.LazyFrame)
+
+    # 1 - kayıtlı tablonun girdilerle aynı veriden kurulup kurulmadığının kontrolü
+    if path is not None:
+        meta_path = f"{path}.json"
+        fingerprints = pl.collect_all([
+            frame.lazy().select(
+                pl.len().alias("rows"),
+                pl.struct(user_col, time_col).hash(seed=0).sum().cast(pl.String).alias("hash_sum")
+            )
+            for frame in frames
+        ])
+        meta = {"user_col": user_col, "time_col": time_col, "frames": [fingerprint.row(0, named=True) for fingerprint in fingerprints]}
+        if not rebuild and os.path.exists(path) and os.path.exists(meta_path):
+            with open(meta_path) as f:
+                if json.load(f) == meta:
+                    steps = pl.scan_parquet(path)
+                    return steps if lazy else steps.collect()
+
+    # 2 - step numaraları
+    steps = (
+        pl.concat([frame.lazy().select([user_col, time_col]) for frame in frames], how="vertical_relaxed")
+        .unique()
+        .sort([user_col, time_col])
+        .with_columns(pl.cum_count(time_col).over(user_col).alias("interaction_step"))
+    )
+
+    if path is not None:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        steps.sink_parquet(path)
+        with open(meta_path, "w") as f:
+            json.dump(meta, f, indent=2)
+        steps = pl.scan_parquet(path)
+
+    return steps if lazy else steps.collect()
+
+
+def _check_step_coverage(frames: list[pl.DataFrame], steps: pl.DataFrame, user_col: str, time_col: str) -> None:
+    """
+    Dışarıdan verilen step_index'in frame'lerdeki tüm (user, time) çiftlerini kapsadığını kontrol eder; kapsamayan
+    çiftler null step alıp decay skorlarını sessizce bozacağı için hata verir. Log'u tam taradığı için sadece
+    check_step_index=True ile çalışır.
+    """
+    missing = pl.collect_all([
+        frame.lazy().select([user_col, time_col]).join(steps.lazy(), on=[user_col, time_col], how="anti").select(pl.len())
+        for frame in frames
+    ])
+    n_missing = sum(frame.item() for frame in missing)
+    if n_missing > 0:
+        raise ValueError(
+            f"step_index {n_missing} (user, time) satırını kapsamıyor; build_interaction_step_index'i güncel log ve "
+            "session'larla (ya da rebuild=True ile) yeniden kurun."
+        )
+
+
+def add_step_decay_state(
+    interactions_df: pl.DataFrame,
+    key_cols: list[str],
+    step_col: str,
+    interaction_cols: list[str],
+    rolling_windows: list[int],
+    decay_factor: float,
+    alias: str
+) -> pl.DataFrame:
+    """
+    key_cols bazında step sırasına göre tek geçişte, her interaction satırının kendi step'inde geçerli decay
+    state'ini ekler: _{col}_decay_state (Σ col * exp(decay_factor * (step - step_j))), son w satır üzerinden
+    weighted/raw rolling kolonları ve _{step_col}_last.
+
+    Decay skoru D(s) = D(r) * exp(decay_factor * (s - r)) + col özyinelemesinin kapalı formudur. exp taşmasını
+    önlemek için step ekseni blok başına en fazla e^600 büyüme olacak şekilde bloklara ayrılır ve her blok bir
+    önceki bloğun toplamını taşır. Weighted kolonlar satırın kendi step'ine göre hesaplanır; sorgu step'ine
+    ölçekleme as-of join sonrasında exp(decay_factor * (s - r)) çarpımıyla yapılır.
+    """
+    block_size = int(600 / abs(decay_factor)) if decay_factor != 0 else None
+
+    # 1 - key içi sıra ve blok numaraları (sıralı tablo üzerinde shift + forward_fill)
+    key_start = pl.any_horizontal([pl.col(col).ne_missing(pl.col(col).shift(1)) for col in key_cols])
+    interactions_df = interactions_df.sort(key_cols + [step_col]).with_row_index("_row").with_columns(
+        key_start.alias("_key_start")
+    ).with_columns(
+        (pl.col("_row") - pl.when(pl.col("_key_start")).then(pl.col("_row")).forward_fill()).alias("_position"),
+        pl.when(pl.col("_key_start")).then(pl.col(step_col)).forward_fill().alias("_first_step")
+    )
+    interactions_df = interactions_df.with_columns(
+        ((pl.col(step_col) - pl.col("_first_step")) // block_size if block_size else pl.lit(0)).alias("_block")
+    ).with_columns(
+        (pl.col("_first_step") + pl.col("_block") * (block_size or 0)).alias("_block_base"),
+        (pl.col("_key_start") | pl.col("_block").ne_missing(pl.col("_block").shift(1))).alias("_segment_start")
+    ).with_columns(
+        pl.col("_segment_start").cum_sum().alias("_segment"),
+        *[(pl.col(col) * (-decay_factor * (pl.col(step_col) - pl.col("_block_base"))).exp()).alias(f"_{col}_scaled") for col in interaction_cols]
+    ).with_columns(
+        *[pl.col(f"_{col}_scaled").cum_sum().over("_segment").alias(f"_{col}_partial") for col in interaction_cols]
+    )
+
+    # 2 - bir önceki bloktan taşınan decay toplamı
+    carry_decay = (decay_factor * (pl.col("_block_base") - pl.col("_block_base").shift(1))).exp()
+    interactions_df = interactions_df.with_columns(
+        *[pl.when(pl.col("_key_start")).then(0.0)
+          .when(pl.col("_segment_start")).then(pl.col(f"_{col}_partial").shift(1) * carry_decay)
+          .forward_fill().alias(f"_{col}_carry") for col in interaction_cols]
+    )
+
+    # 3 - son w satır için step farkına göre ağırlıklı değerler (global shift + key içi maske)
+    def _lag(col: str, k: int, weighted: bool) -> pl.Expr:
+        value = pl.col(col).shift(k)
+        if weighted:
+            value = value * (decay_factor * (pl.col(step_col) - pl.col(step_col).shift(k))).exp()
+        return pl.when(pl.col("_position") >= k).then(value)
+
+    def _window_size(window: int) -> pl.Expr:
+        return pl.min_horizontal(pl.col("_position") + 1, pl.lit(window))
+
+    def _rolling(col: str, window: int) -> list[pl.Expr]:
+        raw_sum = pl.sum_horizontal([_lag(col, k, False) for k in range(window)])
+        return [
+            (pl.sum_horizontal([_lag(col, k, True) for k in range(window)]) / _window_size(window)).alias(f"{col}_weighted_{window}roll_step_mean_{alias}"),
+            (raw_sum / _window_size(window)).alias(f"{col}_{window}roll_step_mean_{alias}"),
+            raw_sum.alias(f"{col}_{window}roll_step_sum_{alias}")
+        ]
+
+    def _rolling_std(col: str, window: int) -> pl.Expr:
+        weighted_mean = pl.col(f"{col}_weighted_{window}roll_step_mean_{alias}")
+        weighted_var = pl.sum_horizontal([(_lag(col, k, True) - weighted_mean) ** 2 for k in range(window)]) / (_window_size(window) - 1)
+        return pl.when(_window_size(window) > 1).then(weighted_var.sqrt()).alias(f"{col}_weighted_{window}roll_step_std_{alias}")
+
+    interactions_df = interactions_df.with_columns(
+        *[((pl.col(f"_{col}_partial") + pl.col(f"_{col}_carry"))
+           * (decay_factor * (pl.col(step_col) - pl.col("_block_base"))).exp()).alias(f"_{col}_decay_state") for col in interaction_cols],
+        *[expr for col in interaction_cols for window in rolling_windows for expr in _rolling(col, window)],
+        pl.col(step_col).alias(f"_{step_col}_last")
+    ).with_columns(
+        *[_rolling_std(col, window) for col in interaction_cols for window in rolling_windows]
+    )
+
+    return interactions_df.drop(
+        ["_row", "_key_start", "_position", "_first_step", "_block", "_block_base", "_segment_start", "_segment"]
+        + [f"_{col}_{suffix}" for col in interaction_cols for suffix in ["scaled", "partial", "carry"]]
+    )
+
 
 def add_decay_features_multiple(
     train_df: pl.DataFrame,
@@ -12,62 +179,141 @@ def add_decay_features_multiple(
     user_col: str = "user_id_hashed",
     content_col: str = "content_id_hashed",
     time_col: str = "ts_hour",
-    alias: str = "fashion"
+    alias: str = "fashion",
+    aligned: bool = False,
+    step_index: pl.DataFrame = None,
+    check_step_index: bool = False
 ) -> pl.DataFrame:
     """
     train_df ve interactions_df tablolarından yarı ömür decay ile geçmiş etkileşim skorlarını ekler.
+
+    Skorlar (user, content) bazında tek sıralı geçişte hesaplanır (add_step_decay_state) ve session'lara
+    interaction_step üzerinden backward as-of join ile eklenir; train x geçmiş join'i yapılmaz.
+    Rolling pencereleri ilgili (user, content) çiftinin session'dan önceki son w log satırı üzerindendir.
+    step_index verilmezse step tablosu interactions_df ve train_df'ten kurulur (build_interaction_step_index);
+    check_step_index=True ile verilen step_index'in log ve session'ları kapsadığı kontrol edilir.
     """
     if interaction_cols is None:
         raise ValueError("`interaction_cols` hesaplanması gereken kolonları barındırmalıdır.")
 
+    if aligned:
+        train_df, input_cols = add_row_index(train_df)
+
     # 1 Tüm session step numaralarının hesaplanması
-    interaction_steps = interactions_df.group_by([user_col, time_col]).agg(pl.count())
-    train_steps = train_df.group_by([user_col, time_col]).agg(pl.count())
-    
-    steps = (
-        pl.concat([interaction_steps, train_steps], how="vertical")
-        .unique(subset=[user_col, time_col], keep="last")
-        .sort([user_col, time_col]).with_columns(
-        pl.cum_count(time_col).over(user_col).alias("interaction_step"))
-        .drop("count")
-    )
-    steps = steps
+    if step_index is None:
+        steps = build_interaction_step_index([interactions_df, train_df], user_col, time_col)
+    else:
+        if check_step_index:
+            _check_step_coverage([interactions_df, train_df], step_index, user_col, time_col)
+        steps = step_index.lazy() if isinstance(train_df, pl.LazyFrame) else step_index.lazy().collect()
+    steps = record_stage("add_decay_features_multiple", "1 - interaction steps", steps)
 
     # 2 Step numaralarının birleştirilmesi
-    interactions_df = interactions_df.join(
+    interactions_df = record_stage("add_decay_features_multiple", "2 - interactions step join", interactions_df.join(
         steps,
         on=[user_col, time_col],
         how="left"
-    ).sort([user_col, time_col])
+    ), inputs=[interactions_df], join=True)
 
-    train_df = train_df.join(
+    train_df = record_stage("add_decay_features_multiple", "2 - train step join", train_df.join(
         steps,
         on=[user_col, time_col],
         how="left"
-    ).sort([user_col, time_col])
+    ), inputs=[train_df], join=True)
+
+    # 3 (user, content) bazında decay state
+    decay_factor = decay_value / decay_life
+    interaction_cols = [col for col in interaction_cols if col in interactions_df.collect_schema().names()]
+    state_df = add_step_decay_state(
+        interactions_df.select([user_col, content_col, "interaction_step"] + interaction_cols),
+        [user_col, content_col],
+        "interaction_step",
+        interaction_cols,
+        rolling_windows,
+        decay_factor,
+        alias
+    ).unique(subset=[user_col, content_col, "interaction_step"], keep="last", maintain_order=True).sort("interaction_step")
+    state_df = record_stage("add_decay_features_multiple", "3 - decay state", state_df)
+
+    # 4 Sadece geçmiş step'lerin eklenmesi
+    final_df = record_stage("add_decay_features_multiple", "4 - as-of join", train_df.sort("interaction_step").join_asof(
+        state_df,
+        on="interaction_step",
+        by=[user_col, content_col],
+        strategy="backward",
+        allow_exact_matches=False,
+        check_sortedness=False
+    ), inputs=[train_df], join=True)
+
+    # 5 Session step'ine göre decay ölçekleme
+    decay = (decay_factor * (pl.col("interaction_step") - pl.col("_interaction_step_last"))).exp()
+    decay_cols = [f"{col}_decay_score_{alias}" for col in interaction_cols]
+    rolling_cols = []
+    for col in interaction_cols:
+        for window in rolling_windows:
+            rolling_cols.extend([
+                f"{col}_weighted_{window}roll_step_mean_{alias}",
+                f"{col}_weighted_{window}roll_step_std_{alias}",
+                f"{col}_{window}roll_step_mean_{alias}",
+                f"{col}_{window}roll_step_sum_{alias}"
+            ])
+    final_df = final_df.with_columns(
+        *[(pl.col(f"_{col}_decay_state") * decay).alias(f"{col}_decay_score_{alias}") for col in interaction_cols],
+        *[(pl.col(c) * decay).alias(c) for c in rolling_cols if "_weighted_" in c],
+        *[pl.col(col).alias(f"{col}_{alias}") for col in interaction_cols]
+    )
+
+    final_df = final_df.select(
+        train_df.collect_schema().names() + decay_cols + rolling_cols + [f"{col}_{alias}" for col in interaction_cols]
+    ).drop(["interaction_step"])
+
+    final_df = final_df.with_columns([pl.col(c).fill_null(0) for c in decay_cols + rolling_cols])
+    final_df = record_stage("add_decay_features_multiple", "5 - decay scaling", final_df)
 
-    # 3 Join (user + content üzerinden)
-    joined = train_df.unique(subset=[user_col,content_col,time_col,"interaction_step"], keep="first").join(
+    if aligned:
+        final_df = select_aligned(final_df, input_cols)
+
+    return final_df
+
+
+def _add_single_key_decay_scores(
+    train_df: pl.DataFrame,
+    interactions_df: pl.DataFrame,
+    interaction_cols: list[str],
+    decay_factor: float,
+    rolling_windows: list[int],
+    user_col: str,
+    time_col: str,
+    alias: str,
+    stage: str = ""
+) -> pl.DataFrame:
+    """
+    interaction_step kolonu eklenmiş train_df ve interactions_df üzerinden user bazında decay skorlarını ve
+    rolling kolonlarını hesaplar; add_decay_features_single_key'in join adımlarıdır. stage, profile_stages
+    kayıtlarındaki adım adlarına eklenir (bucket etiketi).
+    """
+    # 1 Join (user üzerinden)
+    sessions = train_df.unique(subset=[user_col,time_col,"interaction_step"], keep="first")
+    joined = record_stage("add_decay_features_single_key", f"1 - user history join{stage}", sessions.join(
         interactions_df,
-        on=[user_col, content_col],
+        on=user_col,
         how="left"
-    )
+    ), inputs=[sessions, interactions_df], join=True)
 
-    # 4 Sadece geçmiş interaksiyonları al
-    joined = joined.filter(pl.col("interaction_step") > pl.col("interaction_step_right"))
+    # 2 Sadece geçmiş interaksiyonları al
+    joined = record_stage("add_decay_features_single_key", f"2 - past filter{stage}", joined.filter(pl.col("interaction_step") > pl.col("interaction_step_right")))
 
-    # 5 Step farkı
+    # 3 Step farkı
     joined = joined.with_columns(
         (pl.col("interaction_step") - pl.col("interaction_step_right")).alias("step_diff")
     )
 
-    # 6 Decay hesaplama
-    decay_factor = decay_value / decay_life
+    # 4 Decay hesaplama
     joined = joined.with_columns(
         (pl.col("step_diff") * decay_factor).exp().alias("decay")
     )
 
-    # 7 Weighted değerler
+    # 5 Weighted değerler
     weighted_cols = []
     for col in interaction_cols:
         if col in joined.collect_schema().names():
@@ -75,7 +321,7 @@ def add_decay_features_multiple(
             joined = joined.with_columns((pl.col(col) * pl.col("decay")).alias(w_col))
             weighted_cols.append(w_col)
 
-    # 8 rolling cols
+    # 6 rolling cols
     joined = joined.sort([user_col, "interaction_step_right"])
     rolling_cols = []
     for col in interaction_cols:
@@ -89,43 +335,126 @@ def add_decay_features_multiple(
                 joined = joined.with_columns(
                     (pl.col(weighted_col)
                     .rolling_mean(window_size=window, min_periods=1)
-                    .over([user_col,content_col])
+                    .over(user_col)
                     .alias(rolling_col_mean_decayed)),
                     (pl.col(weighted_col)
                     .rolling_std(window_size=window, min_periods=1)
-                    .over([user_col,content_col])
+                    .over(user_col)
                     .alias(rolling_col_std_decayed)),
                     (pl.col(col)
                     .rolling_mean(window_size=window, min_periods=1)
-                    .over([user_col,content_col])
+                    .over(user_col)
                     .alias(rolling_col_mean)),
                     (pl.col(col)
                     .rolling_sum(window_size=window, min_periods=1)
-                    .over([user_col,content_col])
+                    .over(user_col)
                     .alias(rolling_col_sum))
                 )
                 rolling_cols.extend([rolling_col_mean_decayed, rolling_col_std_decayed, rolling_col_mean, rolling_col_sum])
+    joined = record_stage("add_decay_features_single_key", f"3-6 - decay and rolling{stage}", joined)
+
+    # 7 Session bazında topla
+    agg_df = record_stage("add_decay_features_single_key", f"7 - session aggregation{stage}", joined.group_by(["interaction_step", user_col]).agg(
+        [pl.sum(c).alias(c.replace("_weighted", f"_decay_score_{alias}")) for c in weighted_cols]+[pl.last(c) for c in rolling_cols]
+    ))
 
-    # 9 Session bazında topla
-    agg_df = joined.group_by(["interaction_step", user_col, content_col]).agg(
-        *[pl.sum(c).alias(c.replace("_weighted", f"_decay_score_{alias}")) for c in weighted_cols],
-        *[pl.last(c) for c in rolling_cols],
-        *[pl.last(c).alias(f"{c}_{alias}") for c in interaction_cols]
-    )
     decay_cols = [c for c in agg_df.collect_schema().names() if c.endswith(f"_decay_score_{alias}")]
 
-    # 10 Ana tabloya geri ekle
-    final_df = train_df.join(
+    # 8 Ana tabloya geri ekle
+    final_df = record_stage("add_decay_features_single_key", f"8 - session join{stage}", train_df.join(
         agg_df,
-        on=["interaction_step", user_col, content_col],
+        on=["interaction_step",user_col],
         how="left"
-    ).drop(["interaction_step"])
+    ).drop(["interaction_step"]), inputs=[train_df], join=True)
 
     final_df = final_df.with_columns([pl.col(c).fill_null(0) for c in decay_cols + rolling_cols])
 
     return final_df
 
 
+def _add_single_key_decay_scores_partitioned(
+    train_df: pl.DataFrame,
+    interactions_df: pl.DataFrame,
+    n_buckets: int,
+    max_bucket_rows: int,
+    user_col: str,
+    **score_params
+) -> tuple[pl.DataFrame, pl.DataFrame]:
+    """
+    User'ları join ara satır sayılarına göre bucket'lara dağıtır ve _add_single_key_decay_scores'u her bucket için
+    ayrı çalıştırır; (sonuç, bucket raporu) döndürür. Ara satır sayısı user başına tekil session sayısı x
+    interaction sayısıdır (geçmişi olmayan user'ın her session'ı left join'de bir satır verir), yani bucket'ın
+    "1 - user history join" adımının satır sayısıyla aynıdır.
+
+    User'lar ara satır sayısına göre büyükten küçüğe en hafif bucket'a eklenir; max_bucket_rows verilirse bir user
+    en hafif bucket'a sığmıyorsa yeni bucket açılır, yani tek başına sınırı aşan ağır user'lar kendi bucket'ında
+    çalışır. profile_stages aktifse her bucket'ın adımları bucket etiketiyle kaydedilir.
+    """
+    lazy = isinstance(train_df, pl.LazyFrame)
+    train_df, interactions_df = train_df.lazy(), interactions_df.lazy()
+
+    # 1 User başına join ara satır sayısı
+    user_rows = train_df.unique(subset=[user_col, "interaction_step"]).group_by(user_col).agg(
+        pl.len().alias("train_rows")
+    ).join(
+        interactions_df.group_by(user_col).agg(pl.len().alias("interaction_rows")),
+        on=user_col,
+        how="left"
+    ).select(
+        pl.col(user_col),
+        (pl.col("train_rows") * pl.col("interaction_rows").fill_null(1)).alias("joined_rows")
+    ).sort("joined_rows", descending=True).collect()
+
+    # 2 User'ların greedy olarak en hafif bucket'a atanması
+    heap = [(0, b) for b in range(n_buckets)]
+    buckets = []
+    for rows in user_rows["joined_rows"]:
+        bucket_rows, b = heap[0]
+        if max_bucket_rows is None or bucket_rows == 0 or bucket_rows + rows <= max_bucket_rows:
+            heapq.heapreplace(heap, (bucket_rows + rows, b))
+        else:
+            b = len(heap)
+            heapq.heappush(heap, (rows, b))
+        buckets.append(b)
+    assignment = user_rows.with_columns(pl.Series("bucket", buckets, dtype=pl.UInt32))
+    bucket_report = pl.DataFrame({"bucket": range(len(heap))}, schema={"bucket": pl.UInt32}).join(
+        assignment.group_by("bucket").agg(pl.len().alias("users"), pl.sum("joined_rows")),
+        on="bucket",
+        how="left"
+    ).with_columns(pl.col("users", "joined_rows").fill_null(0))
+
+    # 3 Bucket bazında hesaplama
+    bucket_frames = []
+    for b in range(len(heap)):
+        users = assignment.lazy().filter(pl.col("bucket") == b).select(user_col)
+        bucket_frames.append(_add_single_key_decay_scores(
+            train_df.join(users, on=user_col, how="semi", nulls_equal=True),
+            interactions_df.join(users, on=user_col, how="semi"),
+            user_col=user_col,
+            stage=f" [bucket {b + 1}/{len(heap)}]",
+            **score_params
+        ).collect())
+
+    final_df = pl.concat(bucket_frames, how="vertical_relaxed")
+    return (final_df.lazy() if lazy else final_df), bucket_report
+
+
+def _joined_row_bytes(
+    train_df: pl.DataFrame,
+    interactions_df: pl.DataFrame,
+    interaction_cols: list[str],
+    rolling_windows: list[int]
+) -> int:
+    """
+    _add_single_key_decay_scores'taki session x geçmiş ara tablosunun satır başına tahmini byte'ı: session ve log
+    kolonları, step farkı ve decay, her interaction kolonu için weighted kolon ve pencere başına 4 rolling kolon.
+    """
+    log_cols = interactions_df.collect_schema().names()
+    n_interaction = len([col for col in interaction_cols if col in log_cols])
+    n_cols = len(train_df.collect_schema()) + len(log_cols) + 2 + n_interaction * (1 + 4 * len(rolling_windows))
+    return 8 * n_cols
+
+
 def add_decay_features_single_key(
     train_df: pl.DataFrame,
     interactions_df: pl.DataFrame,
@@ -135,116 +464,82 @@ def add_decay_features_single_key(
     rolling_windows: list[int] = [3,6,12],
     user_col: str = "user_id_hashed",
     time_col: str = "ts_hour",
-    alias: str = None
+    alias: str = None,
+    aligned: bool = False,
+    step_index: pl.DataFrame = None,
+    check_step_index: bool = False,
+    n_buckets: int = 1,
+    max_bucket_rows: int = None,
+    memory_budget_mb: float = None,
+    return_report: bool = False
 ) -> pl.DataFrame:
     """
     train_df ve interactions_df tablolarından yarı ömür decay ile geçmiş etkileşim skorlarını ekler.
+
+    n_buckets > 1, max_bucket_rows ya da memory_budget_mb verildiğinde user'lar ara satır sayılarına (session x user
+    geçmişi join'i) göre bucket'lara dağıtılır ve her bucket ayrı ayrı hesaplanıp sonuçlar alt alta eklenir.
+    max_bucket_rows bir satır sayısıdır: bucket'lar bu sınırı geçmeyecek şekilde yeni bucket açılır, sınırı tek başına
+    aşan user kendi bucket'ında çalışır. memory_budget_mb verilirse satır sınırı, ara tablonun şemasından tahmin
+    edilen satır genişliği (kolon başına 8 byte) ile bu bellek bütçesinden hesaplanır; ikisi birden verilirse küçük
+    olan kullanılır. return_report=True ile (sonuç, bucket raporu) döndürülür; rapor bucket başına user ve ara satır
+    sayısını içerir, bucket'lanmayan çalıştırmada None'dır. Step numaraları user bazında olduğu için sonuç tek
+    seferlik çalıştırmayla aynıdır.
+    step_index verilmezse step tablosu interactions_df ve train_df'ten kurulur (build_interaction_step_index);
+    check_step_index=True ile verilen step_index'in log ve session'ları kapsadığı kontrol edilir.
     """
     if interaction_cols is None:
         raise ValueError("`interaction_cols` hesaplanması gereken kolonları barındırmalıdır.")
     if alias is None:
         raise ValueError("`alias` isimlendirilmesi verilmek zorundadır.")
 
-    # 1 Tüm session step numaralarının hesaplanması
-    interaction_steps = interactions_df.group_by([user_col, time_col]).agg(pl.count())
-    train_steps = train_df.group_by([user_col, time_col]).agg(pl.count())
+    if aligned:
+        train_df, input_cols = add_row_index(train_df)
 
-    steps = (
-        pl.concat([interaction_steps, train_steps], how="vertical")
-        .unique(subset=[user_col, time_col], keep="last")
-        .sort([user_col, time_col]).with_columns(
-        pl.cum_count(time_col).over(user_col).alias("interaction_step"))
-        .drop("count")
-    )
-    steps = steps
+    # 1 Tüm session step numaralarının hesaplanması
+    if step_index is None:
+        steps = build_interaction_step_index([interactions_df, train_df], user_col, time_col)
+    else:
+        if check_step_index:
+            _check_step_coverage([interactions_df, train_df], step_index, user_col, time_col)
+        steps = step_index.lazy() if isinstance(train_df, pl.LazyFrame) else step_index.lazy().collect()
+    steps = record_stage("add_decay_features_single_key", "1 - interaction steps", steps)
 
     # 2 Step numaralarının birleştirilmesi
-    interactions_df = interactions_df.join(
+    interactions_df = record_stage("add_decay_features_single_key", "2 - interactions step join", interactions_df.join(
         steps,
         on=[user_col, time_col],
         how="left"
-    ).sort([user_col, time_col])
+    ).sort([user_col, time_col]), inputs=[interactions_df], join=True)
 
-    train_df = train_df.join(
+    train_df = record_stage("add_decay_features_single_key", "2 - train step join", train_df.join(
         steps,
         on=[user_col, time_col],
         how="left"
-    ).sort([user_col, time_col])
+    ).sort([user_col, time_col]), inputs=[train_df], join=True)
 
-    # 3 Join (user + content üzerinden)
-    joined = train_df.unique(subset=[user_col,time_col,"interaction_step"], keep="first").join(
-        interactions_df,
-        on=user_col,
-        how="left"
-    )
-
-    # 4 Sadece geçmiş interaksiyonları al
-    joined = joined.filter(pl.col("interaction_step") > pl.col("interaction_step_right"))
-
-    # 5 Step farkı
-    joined = joined.with_columns(
-        (pl.col("interaction_step") - pl.col("interaction_step_right")).alias("step_diff")
-    )
-
-    # 6 Decay hesaplama
+    # 3 Decay skorları (tek sefer ya da user bucket'ları üzerinden)
     decay_factor = decay_value / decay_life
-    joined = joined.with_columns(
-        (pl.col("step_diff") * decay_factor).exp().alias("decay")
+    score_params = dict(
+        interaction_cols=interaction_cols,
+        decay_factor=decay_factor,
+        rolling_windows=rolling_windows,
+        user_col=user_col,
+        time_col=time_col,
+        alias=alias
     )
-
-    # 7 Weighted değerler
-    weighted_cols = []
-    for col in interaction_cols:
-        if col in joined.collect_schema().names():
-            w_col = f"{col}_weighted"
-            joined = joined.with_columns((pl.col(col) * pl.col("decay")).alias(w_col))
-            weighted_cols.append(w_col)
-
-    # 8 rolling cols
-    joined = joined.sort([user_col, "interaction_step_right"])
-    rolling_cols = []
-    for col in interaction_cols:
-        if col in joined.collect_schema().names():
-            for window in rolling_windows:
-                weighted_col = f"{col}_weighted"
-                rolling_col_mean_decayed = f"{weighted_col}_{window}roll_step_mean_{alias}"
-                rolling_col_std_decayed = f"{weighted_col}_{window}roll_step_std_{alias}"
-                rolling_col_mean = f"{col}_{window}roll_step_mean_{alias}"
-                rolling_col_sum = f"{col}_{window}roll_step_sum_{alias}"
-                joined = joined.with_columns(
-                    (pl.col(weighted_col)
-                    .rolling_mean(window_size=window, min_periods=1)
-                    .over(user_col)
-                    .alias(rolling_col_mean_decayed)),
-                    (pl.col(weighted_col)
-                    .rolling_std(window_size=window, min_periods=1)
-                    .over(user_col)
-                    .alias(rolling_col_std_decayed)),
-                    (pl.col(col)
-                    .rolling_mean(window_size=window, min_periods=1)
-                    .over(user_col)
-                    .alias(rolling_col_mean)),
-                    (pl.col(col)
-                    .rolling_sum(window_size=window, min_periods=1)
-                    .over(user_col)
-                    .alias(rolling_col_sum))
-                )
-                rolling_cols.extend([rolling_col_mean_decayed, rolling_col_std_decayed, rolling_col_mean, rolling_col_sum])
-
-    # 9 Session bazında topla
-    agg_df = joined.group_by(["interaction_step", user_col]).agg(
-        [pl.sum(c).alias(c.replace("_weighted", f"_decay_score_{alias}")) for c in weighted_cols]+[pl.last(c) for c in rolling_cols]
-    )
-
-    decay_cols = [c for c in agg_df.collect_schema().names() if c.endswith(f"_decay_score_{alias}")]
-
-    # 10 Ana tabloya geri ekle
-    final_df = train_df.join(
-        agg_df,
-        on=["interaction_step",user_col],
-        how="left"
-    ).drop(["interaction_step"])
-
-    final_df = final_df.with_columns([pl.col(c).fill_null(0) for c in decay_cols + rolling_cols])
-
-    return final_df
\ No newline at end of file
+    if memory_budget_mb is not None:
+        budget_rows = int(memory_budget_mb * 2**20 // _joined_row_bytes(train_df, interactions_df, interaction_cols, rolling_windows))
+        max_bucket_rows = budget_rows if max_bucket_rows is None else min(max_bucket_rows, budget_rows)
+
+    bucket_report = None
+    if n_buckets == 1 and max_bucket_rows is None:
+        final_df = _add_single_key_decay_scores(train_df, interactions_df, **score_params)
+    else:
+        final_df, bucket_report = _add_single_key_decay_scores_partitioned(
+            train_df, interactions_df, n_buckets, max_bucket_rows, **score_params
+        )
+
+    if aligned:
+        final_df = select_aligned(final_df, input_cols)
+
+    return (final_df, bucket_report) if return_report else final_df
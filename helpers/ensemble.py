@@ -0,0 +1,96 @@
+import polars as pl
+
+from helpers.id_encoding import decode_ids
+
+
+def align_scores(
+    keys: pl.DataFrame,
+    scores: dict[str, pl.DataFrame],
+    on: list[str] = ["session_id", "content_id_hashed"],
+    score_col: str = "prediction"
+) -> pl.DataFrame:
+    """
+    Modellerin tahminlerini keys'in satır sırasına hizalar; her model score_col'u model adıyla bir kolon olur.
+
+    Anahtarları keys ile aynı sırada olan tahminler join yapılmadan eklenir, diğerleri anahtarlar üzerinden tek
+    left join ile hizalanır. Herhangi bir modelde tahmini olmayan satırlar atılır (modeller arası inner join).
+    Anahtarlar encode_ids ile kodlanmış UInt32 kolonlar olduğunda join string anahtarlara göre çok daha ucuzdur.
+    """
+    if isinstance(keys, pl.LazyFrame):
+        keys = keys.collect()
+
+    # 1 - ortak satır indeksi
+    aligned = keys.select(on)
+
+    # 2 - model skorlarının kolon olarak eklenmesi
+    for name, frame in scores.items():
+        if isinstance(frame, pl.LazyFrame):
+            frame = frame.collect()
+        if frame.height == aligned.height and frame.select(on).equals(aligned.select(on)):
+            aligned = aligned.with_columns(frame[score_col].alias(name))
+        else:
+            aligned = aligned.join(
+                frame.select(*on, pl.col(score_col).alias(name)),
+                on=on,
+                how="left",
+                maintain_order="left"
+            )
+
+    return aligned.drop_nulls(list(scores))
+
+
+def blend_scores(
+    df: pl.DataFrame,
+    weights: dict[str, float],
+    method: str = "weighted",
+    group_col: str = "session_id",
+    alias: str = "prediction"
+) -> pl.DataFrame:
+    """
+    align_scores çıktısındaki model kolonlarını weights ile birleştirir.
+
+    method="weighted" skorların ağırlıklı toplamını, method="rank" her modelin session içi normalize rank'inin
+    (rank / session satır sayısı) ağırlıklı toplamını alır; rank ortalaması farklı ölçekteki skorları eşitler.
+    """
+    if method == "weighted":
+        blend = pl.sum_horizontal(pl.col(name) * weight for name, weight in weights.items())
+    elif method == "rank":
+        blend = pl.sum_horizontal(
+            pl.col(name).rank("average").over(group_col) / pl.len().over(group_col) * weight
+            for name, weight in weights.items()
+        )
+    else:
+        raise ValueError(f"Bilinmeyen method: {method} (weighted veya rank olmalı)")
+
+    return df.with_columns(blend.alias(alias))
+
+
+def write_top_k(
+    df: pl.DataFrame,
+    path: str,
+    group_col: str = "session_id",
+    item_col: str = "content_id_hashed",
+    score_col: str = "prediction",
+    k: int = None,
+    dictionaries: dict[str, pl.DataFrame] = None
+) -> None:
+    """
+    Her session için item'ları skora göre azalan sırada (k verilirse ilk k item) yazar.
+
+    Sıralama global sort yerine session bazında agg içinde yapılır. path .parquet ile bitiyorsa item'lar liste
+    kolonu olarak parquet'e, aksi halde boşlukla birleştirilmiş string olarak CSV'ye stream edilir (sink_csv).
+    dictionaries verilirse kodlanmış id'ler yazmadan önce orijinal değerlerine çevrilir.
+    """
+    # 1 - sadece gereken kolonlar ve id'lerin çözülmesi
+    lf = df.lazy().select(group_col, item_col, score_col)
+    if dictionaries is not None:
+        lf = decode_ids(lf, dictionaries)
+
+    # 2 - session bazında skora göre sıralı (top-k) item listesi
+    items = pl.col(item_col).sort_by(score_col, descending=True) if k is None else pl.col(item_col).top_k_by(score_col, k)
+
+    # 3 - parquet: liste kolonu, csv: boşlukla birleştirilmiş string
+    if path.endswith(".parquet"):
+        lf.group_by(group_col).agg(items.alias("prediction")).sink_parquet(path)
+    else:
+        lf.group_by(group_col).agg(items.cast(pl.String).str.join(" ").alias("prediction")).sink_csv(path)
@@ -0,0 +1,272 @@
+import inspect
+import os
+from functools import partial
+from typing import Callable
+
+import polars as pl
+
+from helpers.compaction import compact_dtypes
+from helpers.scheduler import run_graph
+from helpers.streaming import block_log_keys, stream_block
+
+
+# step numaraları session saatlerinden kurulan bloklar; diğer split'in session'ları step aralıklarına girip skorları
+# değiştirdiği için bu bloklar her split için ayrı çalıştırılır
+_SPLIT_DEPENDENT = {"add_decay_features_multiple", "add_decay_features_single_key"}
+
+_DTYPE_BYTES = {
+    pl.Boolean: 1, pl.Int8: 1, pl.UInt8: 1, pl.Int16: 2, pl.UInt16: 2, pl.Int32: 4, pl.UInt32: 4, pl.Float32: 4,
+    pl.Date: 4, pl.Categorical: 4, pl.Enum: 4
+}
+
+
+def prune_side_logs(
+    sessions: pl.LazyFrame,
+    blocks: dict[str, tuple[Callable, dict]]
+) -> dict[str, tuple[Callable, dict]]:
+    """
+    Blokların side log'larını session'larda geçen key'lere (user, content, user-term, content-term ...) semi join
+    ile budar. Helper'ların cum/rolling/decay state'leri key bazında hesaplandığı için session'da geçen key'lerin
+    sonuçları değişmez; session'da hiç geçmeyen key'lerin satırları pencere işlemlerine hiç girmez.
+
+    Her key kombinasyonunun aktif key kümesi bir kez collect edilir ve aynı kümeyi kullanan bloklar paylaşır;
+    aynı log aynı key'lerle budanıyorsa bloklar aynı budanmış LazyFrame'i alır.
+    """
+    # 1 - her blok için budanacak log ve key kolonları
+    prunable = {}
+    for name, (helper, params) in blocks.items():
+        keys = block_log_keys(helper, params)
+        if keys is not None:
+            prunable[name] = keys
+
+    # 2 - aktif key kümelerinin session'lardan bir kez oluşturulması
+    key_sets = {tuple(key_cols): None for _, key_cols in prunable.values()}
+    frames = pl.collect_all([sessions.select(keys).unique() for keys in key_sets])
+    key_sets = dict(zip(key_sets, frames))
+
+    # 3 - log'ların semi join ile budanması
+    pruned, pruned_logs = dict(blocks), {}
+    for name, (log_param, key_cols) in prunable.items():
+        helper, params = blocks[name]
+        log = params[log_param]
+        cache_key = (id(log), tuple(key_cols))
+        if cache_key not in pruned_logs:
+            key_set = key_sets[tuple(key_cols)]
+            pruned_logs[cache_key] = log.join(key_set.lazy(), on=key_cols, how="semi") if isinstance(log, pl.LazyFrame) else log.join(key_set, on=key_cols, how="semi")
+        pruned[name] = (helper, {**params, log_param: pruned_logs[cache_key]})
+
+    return pruned
+
+
+def build_features(
+    sessions: dict[str, pl.LazyFrame],
+    blocks: dict[str, tuple[Callable, dict]],
+    split_col: str = "split",
+    prune_logs: bool = True,
+    dtype_policy: list[tuple[str, pl.DataType]] = None,
+    max_workers: int = None,
+    memory_budget_mb: float = None,
+    streaming_path: str = None,
+    n_partitions: int = 16,
+    n_processes: int = None,
+    required_columns: set[str] = None,
+    return_report: bool = False
+) -> dict[str, pl.DataFrame]:
+    """
+    Tüm session tablolarını (train, test, ...) split etiketiyle alt alta birleştirir, her feature bloğunu
+    (helper, parametreler) birleşik tablo üzerinde tek sefer çalıştırır ve sonucu tekrar split'lere ayırır.
+
+    Side log'lar her blok için bir kez taranır; train ve test için ayrı ayrı cum/rolling hesaplanmaz.
+    Bloklar aligned=True ile çalıştırılır, yani sadece yeni kolonlarını session sırasında döndürür; sonuçlar
+    join yerine yatay concat ile birleştirilir.
+    Decay bloklarında step numaraları log ve session saatlerinden kurulduğu için birleşik tabloda diğer split'in
+    session'ları step aralıklarına girer; bu bloklar her split için ayrı çalıştırılıp alt alta eklenir ve sonuçları
+    split bazlı çalıştırmayla aynıdır. step_index split adı -> step tablosu sözlüğü olarak verilebilir.
+    prune_logs=True ile side log'lar önce session'larda geçen key'lere budanır (prune_side_logs).
+    dtype_policy verilirse her bloğun sonucu birleştirilmeden önce compact_dtypes ile küçültülür; kolon bazlı
+    compaction raporu return_report=True ile alınır. Sonrasında session içi rank alınacaksa float32'de eşitlenen
+    değerler rank'leri değiştirebileceği için küçültme rank'lerden sonra yapılmalıdır.
+    max_workers verilirse bloklar tek collect_all yerine run_graph ile bir bağımlılık grafiği olarak çalışır:
+    birden fazla blokta kullanılan her girdi (LazyFrame) bir kez collect edilir, bloklar max_workers thread'de
+    memory_budget_mb bütçesi içinde paralel çalıştırılır. Node'ların bütçeden ayırdığı pay, kendi okudukları
+    girdilerin şema x satır sayısı ile tahmin edilen boyutunu da içerir.
+    streaming_path verilirse key bazlı bloklar stream_block ile key hash'ine göre n_partitions parçada bellek
+    dışı çalıştırılır ({streaming_path}/{blok adı}); bu blokların girdileri grafikte paylaşılmak için belleğe alınmaz.
+    n_processes verilirse her key bazlı bloğun parçaları o kadar process'te paralel çalıştırılır.
+    required_columns verilirse (model feature'ları ve sonrasında ranking vb. adımlarda kullanılan kolonlar) bloklardan
+    sadece bu kolonlar alınır; required_columns parametresi olan helper'lara iletilir ve bu helper'lar gereksiz
+    pencere, rank ve join'leri hiç kurmaz, diğer blokların fazla kolonları lazy plan'dan çıkarılır.
+    return_report=True ile (split sonuçları, {"graph": run_graph node raporu, "dtype": compaction raporu}) döndürülür;
+    max_workers ya da dtype_policy verilmezse ilgili rapor None'dır.
+    """
+
+    # 1 - session tablolarının split etiketiyle birleştirilmesi
+    session_cols = {name: frame.collect_schema().names() for name, frame in sessions.items()}
+    stacked = pl.concat(
+        [frame.with_columns(pl.lit(name).alias(split_col)) for name, frame in sessions.items()],
+        how="diagonal_relaxed"
+    )
+
+    # 2 - required_columns'un destekleyen helper'lara verilmesi ve side log'ların session key'lerine budanması
+    if required_columns is not None:
+        blocks = {
+            name: (helper, {**params, "required_columns": required_columns})
+            if "required_columns" in inspect.signature(helper).parameters else (helper, params)
+            for name, (helper, params) in blocks.items()
+        }
+
+    if prune_logs:
+        blocks = prune_side_logs(stacked, blocks)
+
+    # 3 - her bloğun birleşik tablo üzerinde bir kez çalıştırılması (key bazlı bloklar istenirse parçalara bölünerek,
+    # decay blokları split bazında)
+    streamed = []
+    if streaming_path is not None:
+        streamed = [name for name, (helper, params) in blocks.items() if block_log_keys(helper, params) is not None]
+    wrapped = {}
+    for name, (helper, params) in blocks.items():
+        path = os.path.join(streaming_path, name) if name in streamed else None
+        if helper.__name__ in _SPLIT_DEPENDENT:
+            helper = partial(_run_per_split, helper, splits=list(sessions), split_col=split_col, path=path, n_partitions=n_partitions, n_processes=n_processes)
+        elif path is not None:
+            helper = partial(stream_block, helper, path=path, n_partitions=n_partitions, n_processes=n_processes)
+        wrapped[name] = (helper, params)
+    blocks = wrapped
+
+    graph_report = None
+    if max_workers is None:
+        frames = pl.collect_all([stacked] + [_select_required(helper(stacked, **params, aligned=True), required_columns) for helper, params in blocks.values()])
+    else:
+        frames, graph_report = _run_block_graph(stacked, blocks, max_workers, memory_budget_mb, unshared=streamed, required_columns=required_columns)
+
+    # 4 - blok sonuçlarının satır sırasına göre yan yana eklenmesi
+    for name, frame in zip(blocks, frames[1:]):
+        if frame.height != frames[0].height:
+            raise ValueError(
+                f"`{name}` bloğu {frame.height:,} satır döndürdü, session tablosu {frames[0].height:,} satır; "
+                "aligned=True ile bloklar session satırlarını birebir korumalıdır."
+            )
+    dtype_report = None
+    if dtype_policy is not None:
+        compacted = [compact_dtypes(frame, dtype_policy) for frame in frames[1:]]
+        frames = [frames[0]] + [frame for frame, _ in compacted]
+        dtype_report = pl.concat([report for _, report in compacted])
+    df = pl.concat(frames, how="horizontal")
+    feature_cols = [col for frame in frames[1:] for col in frame.columns]
+
+    # 5 - split'lere geri ayırma
+    features_by_split = {
+        name: df.filter(pl.col(split_col) == name).select(session_cols[name] + feature_cols)
+        for name in sessions
+    }
+    return (features_by_split, {"graph": graph_report, "dtype": dtype_report}) if return_report else features_by_split
+
+
+def _run_per_split(
+    helper: Callable,
+    df: pl.LazyFrame,
+    splits: list[str],
+    split_col: str,
+    path: str = None,
+    n_partitions: int = 16,
+    n_processes: int = None,
+    aligned: bool = False,
+    **params
+) -> pl.LazyFrame:
+    """
+    Helper'ı birleşik tablonun her split'i için ayrı çalıştırıp sonuçları split sırasıyla alt alta ekler; birleşik
+    tablo split sırasıyla kurulduğu için satır sırası korunur. path verilirse her split stream_block ile
+    {path}/{split} altında çalışır. step_index split adı -> tablo sözlüğü ise her split kendi tablosunu alır.
+    """
+    frames = []
+    for split in splits:
+        split_params = dict(params)
+        if isinstance(params.get("step_index"), dict):
+            split_params["step_index"] = params["step_index"][split]
+        frame = df.filter(pl.col(split_col) == split)
+        if path is None:
+            frames.append(helper(frame, **split_params, aligned=aligned).lazy())
+        else:
+            frames.append(stream_block(helper, frame, os.path.join(path, split), n_partitions, aligned=aligned, n_processes=n_processes, **split_params))
+    return pl.concat(frames, how="vertical")
+
+
+def _select_required(frame: pl.LazyFrame, required_columns: set[str] = None) -> pl.LazyFrame:
+    if required_columns is None:
+        return frame
+    return frame.lazy().select([col for col in frame.collect_schema().names() if col in required_columns])
+
+
+def _run_block_graph(
+    stacked: pl.LazyFrame,
+    blocks: dict[str, tuple[Callable, dict]],
+    max_workers: int,
+    memory_budget_mb: float,
+    unshared: list[str] = [],
+    required_columns: set[str] = None
+) -> tuple[list[pl.DataFrame], pl.DataFrame]:
+    # 1 - birden fazla blokta kullanılan girdiler (aynı LazyFrame nesnesi) tek node olarak paylaşılır
+    usage = {}
+    for name, (helper, params) in blocks.items():
+        if name in unshared:
+            continue
+        for value in params.values():
+            if isinstance(value, pl.LazyFrame):
+                usage[id(value)] = usage.get(id(value), 0) + 1
+
+    nodes = {"sessions": (lambda results: stacked, [])}
+    input_nodes = {}
+    for name, (helper, params) in blocks.items():
+        if name in unshared:
+            continue
+        for param, value in params.items():
+            if isinstance(value, pl.LazyFrame) and usage[id(value)] > 1 and id(value) not in input_nodes:
+                input_nodes[id(value)] = f"input:{name}.{param}"
+                nodes[input_nodes[id(value)]] = (lambda results, value=value: value, [])
+
+    # 2 - blok node'ları: paylaşılan girdiler collect edilmiş halleriyle verilir
+    for name, (helper, params) in blocks.items():
+        shared = {param: input_nodes[id(value)] for param, value in params.items() if id(value) in input_nodes and name not in unshared}
+
+        def run_block(results, helper=helper, params=params, shared=shared):
+            inputs = {param: results[node].lazy() for param, node in shared.items()}
+            return _select_required(helper(results["sessions"].lazy(), **{**params, **inputs}, aligned=True), required_columns)
+
+        nodes[name] = (run_block, ["sessions", *shared.values()])
+
+    # 3 - kaynak node'ların ve blokların kendi içinde okuduğu girdilerin şema x satır sayısı ile boyut tahmini
+    frames = {id(stacked): stacked}
+    for name, (helper, params) in blocks.items():
+        frames.update({id(value): value for value in params.values() if isinstance(value, pl.LazyFrame)})
+    frame_mb = _estimate_frame_mb(frames)
+    input_mb = {"sessions": frame_mb[id(stacked)], **{node: frame_mb[frame_id] for frame_id, node in input_nodes.items()}}
+    for name, (helper, params) in blocks.items():
+        shared = set(nodes[name][1])
+        input_mb[name] = sum(
+            frame_mb[id(value)] for value in params.values()
+            if isinstance(value, pl.LazyFrame) and input_nodes.get(id(value)) not in shared
+        )
+
+    # 4 - grafiğin çalıştırılması
+    results, report = run_graph(nodes, max_workers, memory_budget_mb, keep=["sessions", *blocks], input_mb=input_mb)
+
+    return [results["sessions"]] + [results[name] for name in blocks], report
+
+
+def _estimate_frame_mb(frames: dict[int, pl.LazyFrame], string_bytes: int = 16) -> dict[int, float]:
+    """
+    Her LazyFrame'in satır sayısını alır ve şemadan hesaplanan satır genişliğiyle çarparak
+    belleğe alındığındaki boyutu (MB) tahmin eder. Tanımlı olmayan sabit genişlikli tipler 8 byte, string ve
+    iç içe tipler string_bytes byte sayılır.
+    """
+    # satır sayıları frame başına ayrı collect edilir; polars 1.32 collect_all bazı parquet scan + semi join
+    # kombinasyonlarında projection'ı yanlış budayıp ColumnNotFoundError veriyor
+    estimates = {}
+    for frame_id, frame in frames.items():
+        height = frame.select(pl.len()).collect()
+        row_bytes = sum(
+            _DTYPE_BYTES.get(dtype.base_type(), string_bytes if dtype.is_nested() or dtype == pl.String else 8)
+            for dtype in frame.collect_schema().dtypes()
+        )
+        estimates[frame_id] = height.item() * row_bytes / 2**20
+    return estimates
@@ -0,0 +1,188 @@
+import inspect
+from typing import Callable
+
+import numpy as np
+import polars as pl
+
+
+class HistoryStateStore:
+    """
+    add_user_history / add_user_term_history'nin kümülatif state'ini (sum, max, std momentleri, active session
+    sayısı, session sayısı ve son değer) key başına numpy dizilerinde tutar. Yeni log event'leri update ile
+    artımlı eklenir; get_features batch helper'larla aynı kolon isimlerini session satırlarının sırasıyla döndürür.
+
+    Batch helper'lar session zamanından önceki state'i as-of join ile eklerken store o ana kadar update edilen
+    tüm event'leri kullanır; event'ler zaman sırasıyla verilmelidir.
+    """
+
+    _STATE_NAMES = ["sum", "max", "active", "count", "shift", "s1", "s2", "last"]
+
+    def __init__(
+        self,
+        user_col: str = "user_id_hashed",
+        time_col: str = "ts_hour",
+        interaction_cols: list[str] = ["total_click", "total_fav", "total_cart", "total_order"],
+        ratio_groups: list[tuple[str, str]] = [
+            ("total_click", "total_order"), ("total_click", "total_cart"),
+            ("total_click", "total_fav"), ("total_cart", "total_order")],
+        alias: str = "user_sitewide",
+        weights: dict[str, float] = {"total_click": 0.204, "total_fav": 0.066, "total_cart": 0.254, "total_order": 0.476},
+        term_col: str = None
+    ):
+        self.key_cols = [user_col] + ([term_col] if term_col is not None else [])
+        self.time_col = time_col
+        self.interaction_cols = interaction_cols
+        self.ratio_groups = ratio_groups
+        self.alias = alias
+        self.weights = weights
+
+        self._positions = {}
+        self._session_count = np.zeros(0)
+        self._state = {name: np.zeros((0, len(interaction_cols))) for name in self._STATE_NAMES}
+
+    @classmethod
+    def from_block(cls, helper: Callable, params: dict) -> "HistoryStateStore":
+        """
+        Notebook'taki add_user_history / add_user_term_history bloğunun parametreleriyle store kurar ve
+        params["user_df"] log'unu yükler. Verilmeyen parametreler store'un değil helper'ın varsayılanlarını alır.
+        """
+        args = inspect.signature(helper).bind_partial(**params)
+        args.apply_defaults()
+        store_params = inspect.signature(cls).parameters
+        store = cls(**{key: value for key, value in args.arguments.items() if key in store_params})
+        store.update(params["user_df"])
+        return store
+
+    def _grow(self, size: int) -> None:
+        capacity = len(self._session_count)
+        if size <= capacity:
+            return
+        capacity = max(size, 2 * capacity)
+        self._session_count = np.resize(self._session_count, capacity)
+        for name, values in self._state.items():
+            grown = np.zeros((capacity, values.shape[1]))
+            grown[:len(values)] = values
+            self._state[name] = grown
+
+    def _lookup(self, keys: list[tuple], create: bool = False) -> np.ndarray:
+        if create:
+            for key in keys:
+                if key not in self._positions:
+                    position = len(self._positions)
+                    self._grow(position + 1)
+                    self._session_count[position] = 0
+                    for name, values in self._state.items():
+                        values[position] = np.nan if name in ("max", "shift") else 0
+                    self._positions[key] = position
+        return np.array([self._positions.get(key, -1) for key in keys], dtype=np.int64)
+
+    def update(self, events: pl.DataFrame) -> None:
+        """
+        Yeni log event'lerini key bazında toplayıp state dizilerine ekler.
+        """
+        if isinstance(events, pl.LazyFrame):
+            events = events.collect()
+        events = events.select(self.key_cols + [self.time_col] + self.interaction_cols).sort(self.key_cols + [self.time_col])
+
+        # 1 - key pozisyonları ve std için kaydırma değerleri (key'in ilk değeri)
+        firsts = events.group_by(self.key_cols, maintain_order=True).agg(
+            *[pl.col(col).drop_nulls().first() for col in self.interaction_cols]
+        )
+        positions = self._lookup(list(firsts.select(self.key_cols).iter_rows()), create=True)
+        shift = self._state["shift"][positions]
+        shift = np.where(np.isnan(shift), firsts.select(self.interaction_cols).to_numpy().astype(float), shift)
+        self._state["shift"][positions] = shift
+
+        # 2 - batch içi toplamlar
+        shifts = firsts.select(self.key_cols).with_columns(
+            *[pl.Series(f"_{col}_shift", shift[:, i]) for i, col in enumerate(self.interaction_cols)]
+        )
+        batch = events.join(shifts, on=self.key_cols, how="left").group_by(self.key_cols, maintain_order=True).agg(
+            pl.col(self.time_col).count().alias("_session_count"),
+            *[pl.col(col).sum().alias(f"{col}_sum") for col in self.interaction_cols],
+            *[pl.col(col).max().alias(f"{col}_max") for col in self.interaction_cols],
+            *[(pl.col(col) > 0).sum().alias(f"{col}_active") for col in self.interaction_cols],
+            *[pl.col(col).count().alias(f"{col}_count") for col in self.interaction_cols],
+            *[(pl.col(col) - pl.col(f"_{col}_shift")).sum().alias(f"{col}_s1") for col in self.interaction_cols],
+            *[((pl.col(col) - pl.col(f"_{col}_shift")) ** 2).sum().alias(f"{col}_s2") for col in self.interaction_cols],
+            *[pl.col(col).last().alias(f"{col}_last") for col in self.interaction_cols]
+        )
+
+        # 3 - state dizilerine ekleme
+        def _values(name: str) -> np.ndarray:
+            return batch.select([f"{col}_{name}" for col in self.interaction_cols]).to_numpy().astype(float)
+
+        self._session_count[positions] += batch["_session_count"].to_numpy()
+        for name in ["sum", "active", "count", "s1", "s2"]:
+            self._state[name][positions] += _values(name)
+        self._state["max"][positions] = np.fmax(self._state["max"][positions], _values("max"))
+        self._state["last"][positions] = _values("last")
+
+    def get_features(self, session_rows: pl.DataFrame) -> pl.DataFrame:
+        """
+        session_rows'un key'leri için batch helper'ın ürettiği kolonları satır sırasıyla döndürür; state'i
+        olmayan key'ler batch'teki fill_null(0) gibi 0 alır.
+        """
+        positions = self._lookup(list(session_rows.select(self.key_cols).iter_rows()))
+        known = positions >= 0
+        rows = np.where(known, positions, 0)
+
+        def _state(name: str) -> np.ndarray:
+            values = self._state[name][rows] if len(self._positions) else np.zeros((len(rows), len(self.interaction_cols)))
+            return np.where(known[:, None], values, np.nan)
+
+        alias = self.alias
+        session_count = np.where(known, self._session_count[rows] if len(self._positions) else 0, 0)
+        total, count, s1, s2 = _state("sum"), _state("count"), _state("s1"), _state("s2")
+        with np.errstate(divide="ignore", invalid="ignore"):
+            std = np.where(count > 1, np.sqrt(np.clip((s2 - s1 * s1 / count) / (count - 1), 0, None)), np.nan)
+            avg = np.where(total > 0, total / session_count[:, None], 0)
+            active_ratio = np.where(session_count[:, None] > 0, _state("active") / session_count[:, None], 0)
+
+        features = {}
+        for i, col in enumerate(self.interaction_cols):
+            features[f"{alias}_{col}"] = _state("last")[:, i]
+            features[f"{alias}_{col}_sum"] = total[:, i]
+            features[f"{alias}_{col}_max"] = _state("max")[:, i]
+            features[f"{alias}_{col}_std"] = std[:, i]
+            features[f"{alias}_{col}_active_session_count"] = _state("active")[:, i]
+        features[f"{alias}_session_count"] = session_count
+        for i, col in enumerate(self.interaction_cols):
+            features[f"{alias}_{col}_avg"] = avg[:, i]
+        for i, col in enumerate(self.interaction_cols):
+            features[f"{alias}_{col}_active_session_ratio"] = active_ratio[:, i]
+        for col1, col2 in self.ratio_groups:
+            avg1, avg2 = features[f"{alias}_{col1}_avg"], features[f"{alias}_{col2}_avg"]
+            with np.errstate(divide="ignore", invalid="ignore"):
+                features[f"{alias}_{col1}_to_{col2}_avg_ratio"] = np.where(avg1 > 0, avg2 / avg1, 0)
+        features[f"{alias}_weighted_sum_score"] = sum(np.nan_to_num(features[f"{alias}_{col}_sum"]) * weight for col, weight in self.weights.items())
+        features[f"{alias}_weighted_avg_score"] = sum(features[f"{alias}_{col}_avg"] * weight for col, weight in self.weights.items())
+
+        return pl.DataFrame({name: np.nan_to_num(np.asarray(values, dtype=float)) for name, values in features.items()})
+
+
+class OnlineFeatureStore:
+    """
+    Birden fazla HistoryStateStore'u isimleriyle tutar; update ilgili store'a event ekler, get_features tüm
+    store'ların kolonlarını session satırlarının sırasıyla yan yana döndürür.
+    """
+
+    def __init__(self, stores: dict[str, HistoryStateStore]):
+        self.stores = stores
+
+    @classmethod
+    def from_blocks(cls, blocks: dict[str, tuple]) -> "OnlineFeatureStore":
+        """
+        build_features'a verilen blok sözlüğündeki add_user_history / add_user_term_history bloklarından store kurar.
+        """
+        return cls({
+            name: HistoryStateStore.from_block(helper, params)
+            for name, (helper, params) in blocks.items()
+            if helper.__name__ in ("add_user_history", "add_user_term_history")
+        })
+
+    def update(self, name: str, events: pl.DataFrame) -> None:
+        self.stores[name].update(events)
+
+    def get_features(self, session_rows: pl.DataFrame) -> pl.DataFrame:
+        return pl.concat([store.get_features(session_rows) for store in self.stores.values()], how="horizontal")
@@ -0,0 +1,73 @@
+import os
+
+import polars as pl
+
+
+ID_COLUMNS = ["user_id_hashed", "content_id_hashed", "search_term_normalized", "session_id"]
+
+
+def build_id_dictionaries(
+    frames: list[pl.DataFrame],
+    cols: list[str] = ID_COLUMNS,
+    path: str = None
+) -> dict[str, pl.DataFrame]:
+    """
+    frames içinde geçen tüm id/terim değerleri için kolon başına (value, code) sözlüğü kurar; code UInt32'dir.
+
+    path verilirse her kolonun sözlüğü {path}/{col}.parquet olarak saklanır. Dosya varsa mevcut kodlar korunur ve
+    sadece yeni değerler sıradaki kodlarla eklenir; böylece farklı günlerde kurulan tablolar aynı kodları kullanır.
+    null değerler sözlüğe girmez; encode_ids/decode_ids null'ı null olarak bırakır.
+    """
+    # 1 - her kolon için frame'lerdeki tekil değerler (hiçbir frame'de olmayan kolonlar atlanır)
+    frame_cols = [frame.collect_schema().names() for frame in frames]
+    uniques = {
+        col: pl.concat([frame.lazy().select(pl.col(col).cast(pl.String).alias("value")) for frame, names in zip(frames, frame_cols) if col in names]).drop_nulls().unique()
+        for col in cols if any(col in names for names in frame_cols)
+    }
+    uniques = dict(zip(uniques, pl.collect_all(list(uniques.values()))))
+
+    # 2 - kayıtlı sözlüklerin okunup yeni değerlerin sona eklenmesi
+    dictionaries = {}
+    for col, values in uniques.items():
+        file = os.path.join(path, f"{col}.parquet") if path is not None else None
+        dictionary = pl.read_parquet(file) if file is not None and os.path.exists(file) else pl.DataFrame(schema={"value": pl.String, "code": pl.UInt32})
+        # eski sürümlerin yazdığı null kayıtlar atılır; yeni kodlar en büyük koddan devam eder
+        dictionary = dictionary.drop_nulls("value")
+        next_code = dictionary["code"].max() + 1 if dictionary.height > 0 else 0
+
+        new_values = values.join(dictionary, on="value", how="anti").sort("value")
+        if new_values.height > 0:
+            dictionary = pl.concat([
+                dictionary,
+                new_values.with_columns((pl.int_range(pl.len(), dtype=pl.UInt32) + next_code).alias("code"))
+            ])
+            if file is not None:
+                os.makedirs(path, exist_ok=True)
+                dictionary.write_parquet(file)
+
+        dictionaries[col] = dictionary
+
+    return dictionaries
+
+
+def encode_ids(df: pl.DataFrame, dictionaries: dict[str, pl.DataFrame]) -> pl.DataFrame:
+    """
+    df'teki sözlüğü olan kolonları UInt32 kodlarıyla değiştirir; satır sırası ve kolon sırası korunur.
+    Sözlükte olmayan bir değer hata verir, sözlük tüm session ve log tablolarından kurulmalıdır.
+    """
+    cols = [col for col in df.collect_schema().names() if col in dictionaries]
+    return df.with_columns(
+        pl.col(col).cast(pl.String).replace_strict(dictionaries[col]["value"], dictionaries[col]["code"], return_dtype=pl.UInt32)
+        for col in cols
+    )
+
+
+def decode_ids(df: pl.DataFrame, dictionaries: dict[str, pl.DataFrame]) -> pl.DataFrame:
+    """
+    encode_ids'in tersi; kodlanmış kolonları orijinal string değerlerine çevirir (submission yazımı için).
+    """
+    cols = [col for col in df.collect_schema().names() if col in dictionaries]
+    return df.with_columns(
+        pl.col(col).replace_strict(dictionaries[col]["code"], dictionaries[col]["value"], return_dtype=pl.String)
+        for col in cols
+    )
@@ -0,0 +1,98 @@
+import json
+import time
+import warnings
+from contextlib import contextmanager
+
+import polars as pl
+
+
+class JoinBlowupWarning(UserWarning):
+    pass
+
+
+class StageProfiler:
+    """
+    Helper'ların numaralı adımlarını ölçer. Her adımın çıktısı o anda collect edilir ve sonraki adım
+    materialize edilmiş tablodan devam eder; böylece süre, satır sayısı ve bellek adım bazında ayrışır.
+    Bu mod sadece ölçüm içindir, adımlar arası lazy optimizasyonlar kapanır.
+    """
+
+    def __init__(self, blowup_factor: float = 10.0, explain: bool = False):
+        self.blowup_factor = blowup_factor
+        self.explain = explain
+        self.records = []
+
+    def record(self, helper: str, step: str, df: pl.DataFrame, inputs: list[pl.DataFrame] = None, join: bool = False) -> pl.DataFrame:
+        plan = df.explain() if self.explain and isinstance(df, pl.LazyFrame) else None
+        rows_in = [_height(frame) for frame in inputs or []]
+
+        start = time.perf_counter()
+        collected = df.collect() if isinstance(df, pl.LazyFrame) else df
+        wall_seconds = time.perf_counter() - start
+
+        record = {
+            "helper": helper,
+            "step": step,
+            "wall_seconds": wall_seconds,
+            "rows_in": max(rows_in, default=None),
+            "rows_out": collected.height,
+            "estimated_mb": collected.estimated_size("mb"),
+            "join": join,
+            "plan": plan
+        }
+        self.records.append(record)
+
+        if join and record["rows_in"] and collected.height > self.blowup_factor * record["rows_in"]:
+            warnings.warn(
+                f"{helper} / {step}: join çıktısı {collected.height:,} satır, en büyük girdinin "
+                f"({record['rows_in']:,} satır) {self.blowup_factor} katını aşıyor.",
+                JoinBlowupWarning,
+                stacklevel=3
+            )
+
+        return collected.lazy() if isinstance(df, pl.LazyFrame) else collected
+
+    def report(self) -> pl.DataFrame:
+        return pl.DataFrame(self.records, schema={
+            "helper": pl.String, "step": pl.String, "wall_seconds": pl.Float64, "rows_in": pl.Int64,
+            "rows_out": pl.Int64, "estimated_mb": pl.Float64, "join": pl.Boolean, "plan": pl.String
+        })
+
+    def to_json(self, path: str) -> None:
+        with open(path, "w") as f:
+            json.dump(self.records, f, indent=2)
+
+
+def _height(df: pl.DataFrame) -> int:
+    return df.select(pl.len()).collect().item() if isinstance(df, pl.LazyFrame) else df.height
+
+
+_ACTIVE_PROFILER = None
+
+
+@contextmanager
+def profile_stages(blowup_factor: float = 10.0, explain: bool = False):
+    """
+    Blok içinde çağrılan helper'ların adımlarını ölçer:
+
+        with profile_stages() as profiler:
+            features_by_split = build_features(...)
+        profiler.report()
+    """
+    global _ACTIVE_PROFILER
+    previous = _ACTIVE_PROFILER
+    _ACTIVE_PROFILER = StageProfiler(blowup_factor, explain)
+    try:
+        yield _ACTIVE_PROFILER
+    finally:
+        _ACTIVE_PROFILER = previous
+
+
+def record_stage(helper: str, step: str, df: pl.DataFrame, inputs: list[pl.DataFrame] = None, join: bool = False) -> pl.DataFrame:
+    """
+    profile_stages aktifse adımı ölçüp materialize edilmiş tabloyu döndürür, değilse df'i olduğu gibi döndürür.
+    join=True adımlarda çıktı, inputs içindeki en büyük tablonun blowup_factor katını aşarsa uyarı verir.
+    """
+    if _ACTIVE_PROFILER is None:
+        return df
+    return _ACTIVE_PROFILER.record(helper, step, df, inputs, join)
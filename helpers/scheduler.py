@@ -0,0 +1,101 @@
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable
+
+import polars as pl
+
+
+def run_graph(
+    nodes: dict[str, tuple[Callable, list[str]]],
+    max_workers: int = None,
+    memory_budget_mb: float = None,
+    memory_factor: float = 3.0,
+    keep: list[str] = None,
+    input_mb: dict[str, float] = None
+) -> tuple[dict[str, pl.DataFrame], pl.DataFrame]:
+    """
+    Bağımlılık grafiğindeki node'ları (fonksiyon, bağımlı olduğu node'lar) bir thread havuzunda çalıştırır ve
+    (sonuçlar, node süreleri) döndürür. Her node fonksiyonu {bağımlılık adı: sonuç} sözlüğü ile çağrılır; LazyFrame
+    dönerse worker thread içinde collect edilir. polars collect sırasında GIL'i bıraktığı için bağımsız node'lar
+    gerçekten paralel çalışır.
+
+    memory_budget_mb verilirse bir node, tahmini belleği ((bağımlılıklarının sonuç boyutu + input_mb) x memory_factor)
+    ile tutulan sonuçlar ve çalışan node'ların tahminleri toplamı bütçeyi aşıyorsa başlatılmaz; hiçbir node
+    çalışmıyorsa bütçeyi aşsa da tek başına çalıştırılır. keep dışındaki node'ların sonuçları, onlara bağlı tüm
+    node'lar bitince bırakılır. Hazır node'lar arasında önce bağımlılığı olanlar başlatılır, böylece okunmuş
+    girdiler yeni girdiler okunmadan tüketilir.
+    input_mb, node'un bağımlılıklar dışında kendi içinde okuduğu girdilerin (parquet taramaları, paylaşılmayan
+    log'lar) tahmini boyutudur; verilmezse kaynak node'lar bütçeden hiç pay ayırmaz.
+    """
+    keep = set(nodes if keep is None else keep)
+    input_mb = input_mb or {}
+    max_workers = max_workers or os.cpu_count()
+
+    # 1 - bağımlılık sayaçları
+    deps = {name: list(node_deps) for name, (_, node_deps) in nodes.items()}
+    dependents = {name: 0 for name in nodes}
+    for node_deps in deps.values():
+        for dep in node_deps:
+            dependents[dep] += 1
+
+    results, sizes, reserved, records = {}, {}, {}, []
+    pending = list(nodes)
+    running = {}
+    used_mb = 0.0
+    start = time.perf_counter()
+
+    def _run(name: str) -> tuple[pl.DataFrame, float, float]:
+        fn, _ = nodes[name]
+        node_start = time.perf_counter()
+        out = fn({dep: results[dep] for dep in deps[name]})
+        if isinstance(out, pl.LazyFrame):
+            out = out.collect()
+        return out, node_start - start, time.perf_counter() - node_start
+
+    # 2 - hazır node'ların bütçe dahilinde başlatılması, biten node'ların sonuçlarının toplanması
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        while pending or running:
+            ready = [name for name in pending if all(dep in sizes for dep in deps[name])]
+            ready.sort(key=lambda name: len(deps[name]) == 0)
+            for name in ready:
+                if len(running) >= max_workers:
+                    break
+                estimate = memory_factor * (sum(sizes[dep] for dep in deps[name]) + input_mb.get(name, 0.0))
+                if memory_budget_mb is not None and running and used_mb + estimate > memory_budget_mb:
+                    continue
+                pending.remove(name)
+                reserved[name] = estimate
+                used_mb += estimate
+                running[pool.submit(_run, name)] = name
+            if not running:
+                raise ValueError(f"Bağımlılıkları çözülemeyen node'lar var (döngü?): {pending}")
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name = running.pop(future)
+                out, started, wall_seconds = future.result()
+                results[name] = out
+                sizes[name] = out.estimated_size("mb")
+                used_mb += sizes[name] - reserved[name]
+                records.append({
+                    "node": name,
+                    "started_seconds": started,
+                    "wall_seconds": wall_seconds,
+                    "rows_out": out.height,
+                    "estimated_mb": sizes[name],
+                    "reserved_mb": reserved[name]
+                })
+
+                # 3 - artık kullanılmayan ara sonuçların bırakılması
+                for dep in deps[name]:
+                    dependents[dep] -= 1
+                    if dependents[dep] == 0 and dep not in keep:
+                        used_mb -= sizes[dep]
+                        del results[dep]
+
+    report = pl.DataFrame(records, schema={
+        "node": pl.String, "started_seconds": pl.Float64, "wall_seconds": pl.Float64, "rows_out": pl.Int64,
+        "estimated_mb": pl.Float64, "reserved_mb": pl.Float64
+    })
+    return {name: out for name, out in results.items() if name in keep}, report
@@ -1,5 +1,7 @@
 import polars as pl
 
+from helpers.profiling import record_stage
+
 
 def candidate_counter(
     df: pl.DataFrame,
@@ -40,6 +42,12 @@ def session_based_ranking_for_contents(
     },
     price_columns: list[str] = ["original_price","selling_price","discounted_price"]
 ) -> pl.DataFrame:
+    """
+    Content kolonlarının session içi rank'lerini, ortalama/medyan rank'i ve toplam weighted score'u ekler.
+    Tüm rank'ler session bazında tek with_columns içinde hesaplanır; satır sırası girdiyle, kolon sırası eski
+    sürümle aynıdır (interaction rank'leri, tablo başına weighted score ve rank'i, özet kolonlar,
+    price ve review rank'leri).
+    """
 
     # 1- mevcut content interaction kolonlarinin bulnumasi
     df_cols = df.columns
@@ -66,51 +74,90 @@ def session_based_ranking_for_contents(
                     if non_agg_col2 in df_cols:
                         existing_cols.append(non_agg_col2)
 
-    # 2- mevcut content interaction kolonlarinin ranking'lerinin olusturulmasi
-    for col in existing_cols:
-        df = df.with_columns(
-            (-pl.col(col)).rank(method="min").over(partition_by=session_col).alias(f"rank_{session_col}_{col}")
-        )
-
-    # 3- target weightleriyle content table'larinin kendi icinde weighted score ve ranking'lerinin olusturulmasi
-    weighted_rank_cols = []
-    for table in tables:
-        if table == sitewide_table:
-            cols = cols_sitewide
-        else:
-            cols = cols_search
-        weighted_col = weighted_col_template.format(**{"table":table})
-        df = df.with_columns(
-            pl.sum_horizontal([pl.col(f"{table}_{col}") * weights[col] for col in cols]).alias(weighted_col)
-        )
-        weighted_rank_col = f"rank_{session_col}_{weighted_col}"
-        df = df.with_columns(
-            (-pl.col(weighted_col)).rank(method="min").over(partition_by=session_col).alias(weighted_rank_col)
-        )
-        weighted_rank_cols.append(weighted_rank_col)
-
-    # 4- avg rank, median rank, total weighted score olusturulmasi
-    rank_cols = weighted_rank_cols + [f"rank_{session_col}_{col}" for col in existing_cols]
-
+    # 2- target weightleriyle content table'larinin kendi icinde weighted score'larinin olusturulmasi
+    weighted_cols = [weighted_col_template.format(**{"table":table}) for table in tables]
     df = df.with_columns(
-        (pl.mean_horizontal(rank_cols)).alias("avg_content_search_and_sitewide_rank"),
-        (pl.concat_list(rank_cols).list.median()).alias("median_content_search_and_sitewide_rank"),
-        (pl.sum_horizontal([pl.col(weighted_col_template.format(**{"table":table})) * table_weights[table] for table in tables])).alias("total_content_search_and_sitewide_weighted_score")
+        *[pl.sum_horizontal([pl.col(f"{table}_{col}") * weights[col] for col in (cols_sitewide if table == sitewide_table else cols_search)]).alias(weighted_col)
+          for table, weighted_col in zip(tables, weighted_cols)]
     )
+    df = record_stage("session_based_ranking_for_contents", "2 - weighted scores", df)
 
-    # 5- price ve content review ile alakali rankingler
+    # 3- tum rank'lerin session bazinda tek grouped pass'te olusturulmasi
     low_rank_cols = [f"{col}_log" for col in price_columns]
     high_rank_cols = ["discount_rate","selling_rate","content_rate_avg_bayesian","content_review_count_norm","content_review_wth_media_count_norm"]
     high_rank_cols += ["wilson_score_rate_to_review","wilson_score_review_to_media"]
 
-    for col in low_rank_cols:
-        df = df.with_columns(
-            pl.col(col).rank(method="min").over(partition_by=session_col).alias(f"rank_{session_col}_{col}")
-        )
+    df = df.with_columns(
+        *[(-pl.col(col)).rank(method="min").over(partition_by=session_col).alias(f"rank_{session_col}_{col}") for col in dict.fromkeys(weighted_cols + existing_cols + high_rank_cols)],
+        *[pl.col(col).rank(method="min").over(partition_by=session_col).alias(f"rank_{session_col}_{col}") for col in low_rank_cols]
+    )
+    df = record_stage("session_based_ranking_for_contents", "3 - session ranks", df)
+
+    # 4- avg rank, median rank (rank matrisi uzerinden), total weighted score olusturulmasi
+    rank_cols = [f"rank_{session_col}_{col}" for col in weighted_cols + existing_cols]
+
+    df = df.with_columns(
+        (pl.mean_horizontal(rank_cols)).alias("avg_content_search_and_sitewide_rank"),
+        (pl.concat_arr(rank_cols).arr.median()).alias("median_content_search_and_sitewide_rank"),
+        (pl.sum_horizontal([pl.col(weighted_col) * table_weights[table] for table, weighted_col in zip(tables, weighted_cols)])).alias("total_content_search_and_sitewide_weighted_score")
+    )
+
+    # 5- kolonlarin eski siraya getirilmesi
+    new_cols = [f"rank_{session_col}_{col}" for col in existing_cols]
+    new_cols += [col for weighted_col in weighted_cols for col in (weighted_col, f"rank_{session_col}_{weighted_col}")]
+    new_cols += ["avg_content_search_and_sitewide_rank", "median_content_search_and_sitewide_rank", "total_content_search_and_sitewide_weighted_score"]
+    new_cols += [f"rank_{session_col}_{col}" for col in low_rank_cols + high_rank_cols]
+    df = df.select(list(dict.fromkeys(df_cols + new_cols)))
+
+    return df
+
+def sample_negatives(
+    df: pl.DataFrame,
+    session_col: str = "session_id",
+    content_col: str = "content_id_hashed",
+    target_cols: list[str] = ["ordered", "clicked", "added_to_cart", "added_to_fav"],
+    negative_limit: int = 1000,
+    seed: int = 42,
+    hard_col: str = None,
+    hard_share: float = 0.0,
+    strata_col: str = None
+) -> pl.DataFrame:
+    """
+    Her session'da tüm pozitifleri tutup negatifleri (target_cols toplamı 0) negative_limit ile sınırlar.
+    Satır sırası korunur; LazyFrame ile çalıştığı için feature üretiminden önce de uygulanabilir, ancak bu
+    durumda candidate_counter ve session_based_ranking_for_contents gibi session bazlı feature'lar sadece
+    kalan satırlar üzerinden hesaplanır.
+
+    Rastgele sıra (session, content) hash'inden seed ile üretilir; sonuç satır sırasından bağımsız ve tekrarlanabilirdir.
+    hard_col verilirse negatif kotasının hard_share kadarı hard_col'u en yüksek negatiflerden (hard negative),
+    kalanı rastgele seçilir. strata_col verilirse rastgele negatifler session içinde strata_col gruplarından
+    gruptaki negatif sayısıyla orantılı seçilir.
+    """
+    negative = "_negative"
+    group = [session_col, negative]
+
+    # 1 - negatif satırların ve seed'li rastgele sıranın belirlenmesi
+    df = df.with_columns(
+        (pl.sum_horizontal(target_cols) == 0).alias(negative),
+        pl.struct(session_col, content_col).hash(seed).alias("_random")
+    ).with_row_index("_row")
+
+    # 2 - seçim önceliği: stratified ise grup içi sıra / grup büyüklüğü, değilse rastgele sıra
+    if strata_col is not None:
+        strata = group + [strata_col]
+        priority = (pl.col("_random").rank("ordinal").over(strata) - 0.5) / pl.len().over(strata)
+    else:
+        priority = pl.col("_random").rank("ordinal").over(group).cast(pl.Float64)
+
+    # 3 - hard negative'ler (eşitlikler rastgele sırayla) önceliğin en başına alınır
+    n_hard = int(negative_limit * hard_share)
+    if hard_col is not None and n_hard > 0:
+        df = df.sort(group + [hard_col, "_random"], descending=[False, False, True, False], nulls_last=True)
+        is_hard = pl.int_range(pl.len()).over(group) < n_hard
+        priority = pl.when(is_hard).then(-1.0).otherwise(priority)
 
-    for col in high_rank_cols:
-        df = df.with_columns(
-            (-pl.col(col)).rank(method="min").over(partition_by=session_col).alias(f"rank_{session_col}_{col}")
-        )
+    # 4 - öncelik sırasına göre negatiflerin sınırlanması ve satır sırasının geri alınması
+    df = df.with_columns(priority.alias("_priority")).sort(group + ["_priority", "_random"])
+    df = df.filter(~pl.col(negative) | (pl.int_range(pl.len()).over(group) < negative_limit))
 
-    return df
\ No newline at end of file
+    return df.sort("_row").drop([negative, "_random", "_row", "_priority"])
@@ -0,0 +1,192 @@
+import argparse
+import inspect
+import multiprocessing
+import os
+import pickle
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable
+
+import polars as pl
+
+
+STREAM_ROW = "__stream_row"
+PARTITION_COL = "_partition"
+
+
+# helper adı -> (key bazlı log parametresi, helper argümanlarından key kolonları)
+# add_decay_features_multiple'da step_index verilmezse step'ler log'dan kurulduğu için sadece user key'dir.
+# add_content_price_history ve add_user_metadata global istatistik kullandığından key bazlı değildir.
+_PRUNABLE_LOGS = {
+    "add_user_history": ("user_df", lambda args: [args["user_col"]]),
+    "add_user_term_history": ("user_df", lambda args: [args["user_col"], args["term_col"]]),
+    "add_time_history": ("df_value", lambda args: [args["key_col"]]),
+    "add_decay_features_multiple": ("interactions_df", lambda args: (
+        [args["user_col"], args["content_col"]] if args["step_index"] is not None else [args["user_col"]]
+    )),
+    "add_decay_features_single_key": ("interactions_df", lambda args: [args["user_col"]])
+}
+
+
+def block_log_keys(helper: Callable, params: dict) -> tuple[str, list[str]]:
+    """
+    Helper'ın key bazlı çalıştığı log parametresini ve key kolonlarını (varsayılan parametrelerle) döndürür;
+    helper key bazlı değilse None döner. Bu helper'larda bir key'in sonucu sadece o key'in log satırlarına bağlıdır.
+    """
+    if helper.__name__ not in _PRUNABLE_LOGS:
+        return None
+    log_param, key_cols = _PRUNABLE_LOGS[helper.__name__]
+    args = inspect.signature(helper).bind_partial(**params)
+    args.apply_defaults()
+    return log_param, key_cols(args.arguments)
+
+
+def _sink_partitions(frame: pl.LazyFrame, key_col: str, n_partitions: int, hash_dtype: pl.DataType, path: str) -> None:
+    frame.with_columns(
+        (pl.col(key_col).cast(hash_dtype).hash(seed=0) % n_partitions).alias(PARTITION_COL)
+    ).sink_parquet(pl.PartitionByKey(path, by=PARTITION_COL, include_key=False), mkdir=True)
+
+
+def prepare_shards(
+    helper: Callable,
+    df: pl.DataFrame,
+    path: str,
+    n_partitions: int = 16,
+    **params
+) -> list[str]:
+    """
+    Key bazlı bir helper'ın (block_log_keys) işini shard'lara böler: session'lar ve log, ilk key kolonunun hash'ine
+    göre n_partitions parçaya ayrılıp path altına parquet olarak yazılır; helper ve kalan parametreler
+    path/spec.pkl dosyasına kaydedilir. Bir key'in tüm satırları aynı shard'da olduğu için her shard bağımsızdır.
+    path ortak bir dosya sisteminde ise shard'lar farklı makinelerde run_shards ile çalıştırılabilir; parametrelerdeki
+    LazyFrame'lerin okuduğu dosyalar da worker'lardan erişilebilir olmalıdır. Shard adlarını döndürür.
+    """
+    keys = block_log_keys(helper, params)
+    if keys is None:
+        raise ValueError(f"{helper.__name__} key bazlı bir helper değil; shard'lara bölünerek çalıştırılamaz.")
+    log_param, key_cols = keys
+    key_col = key_cols[0]
+
+    df = df.lazy()
+    log = params[log_param].lazy()
+    session_dtype, log_dtype = df.collect_schema()[key_col], log.collect_schema()[key_col]
+
+    # 1 - session ve log'un key hash'ine göre parçalara yazılması (tipler farklıysa hash string üzerinden)
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    hash_dtype = session_dtype if session_dtype == log_dtype else pl.String
+    _sink_partitions(df.with_row_index(STREAM_ROW), key_col, n_partitions, hash_dtype, os.path.join(path, "sessions"))
+    _sink_partitions(log, key_col, n_partitions, hash_dtype, os.path.join(path, "log"))
+
+    # 2 - worker'ların okuyacağı spec
+    shards = sorted(os.listdir(os.path.join(path, "sessions")))
+    spec = {
+        "helper": helper,
+        "params": {name: value for name, value in params.items() if name != log_param},
+        "log_param": log_param,
+        "log_schema": log.collect_schema(),
+        "input_cols": df.collect_schema().names(),
+        "shards": shards
+    }
+    with open(os.path.join(path, "spec.pkl"), "wb") as f:
+        pickle.dump(spec, f)
+
+    return shards
+
+
+def run_shard(path: str, shard: str) -> str:
+    """
+    Tek bir shard'ı çalıştırır ve yeni kolonları path/result/{shard}.parquet olarak yazar. Sonuç önce geçici dosyaya
+    yazılıp taşındığı için yarıda kalan bir çalıştırma eksik sonuç bırakmaz; sonucu olan shard tekrar çalıştırılmaz.
+    """
+    result_file = os.path.join(path, "result", f"{shard}.parquet")
+    if os.path.exists(result_file):
+        return result_file
+
+    with open(os.path.join(path, "spec.pkl"), "rb") as f:
+        spec = pickle.load(f)
+
+    log_path = os.path.join(path, "log", shard)
+    log = pl.scan_parquet(os.path.join(log_path, "*.parquet")) if os.path.exists(log_path) else pl.LazyFrame(schema=spec["log_schema"])
+    out = spec["helper"](pl.scan_parquet(os.path.join(path, "sessions", shard, "*.parquet")), **spec["params"], **{spec["log_param"]: log})
+
+    os.makedirs(os.path.dirname(result_file), exist_ok=True)
+    temp_file = f"{result_file}.{os.getpid()}.tmp"
+    out.lazy().select(pl.exclude(spec["input_cols"])).sink_parquet(temp_file)
+    os.replace(temp_file, result_file)
+    return result_file
+
+
+def run_shards(path: str, worker: int = 0, n_workers: int = 1, n_processes: int = None) -> list[str]:
+    """
+    prepare_shards ile yazılmış shard'lardan bu worker'a düşenleri (shard sırası % n_workers == worker) çalıştırır.
+    n_processes verilirse shard'lar yerel bir process havuzunda paralel çalışır. Birden fazla makinede her makine
+    aynı path ile farklı worker numarasıyla çağrılır:
+
+        python -m helpers.streaming {path} --worker 0 --workers 4
+    """
+    with open(os.path.join(path, "spec.pkl"), "rb") as f:
+        shards = pickle.load(f)["shards"][worker::n_workers]
+
+    if n_processes is None or n_processes <= 1:
+        return [run_shard(path, shard) for shard in shards]
+
+    with ProcessPoolExecutor(max_workers=n_processes, mp_context=multiprocessing.get_context("spawn")) as pool:
+        return list(pool.map(run_shard, [path] * len(shards), shards))
+
+
+def merge_shards(path: str, df: pl.DataFrame = None) -> pl.LazyFrame:
+    """
+    Shard sonuçlarını orijinal satır sırasında birleştirir; df verilirse yeni kolonlar df'in yanına eklenir.
+    Sonucu olmayan shard varsa hata verir.
+    """
+    with open(os.path.join(path, "spec.pkl"), "rb") as f:
+        shards = pickle.load(f)["shards"]
+    missing = [shard for shard in shards if not os.path.exists(os.path.join(path, "result", f"{shard}.parquet"))]
+    if missing:
+        raise ValueError(f"{len(missing)} shard'ın sonucu yok: {missing[:5]}")
+
+    result = pl.scan_parquet([os.path.join(path, "result", f"{shard}.parquet") for shard in shards]).sort(STREAM_ROW).drop(STREAM_ROW)
+    return result if df is None else pl.concat([df.lazy(), result], how="horizontal")
+
+
+def stream_block(
+    helper: Callable,
+    df: pl.DataFrame,
+    path: str,
+    n_partitions: int = 16,
+    aligned: bool = False,
+    n_processes: int = None,
+    **params
+) -> pl.LazyFrame:
+    """
+    Key bazlı bir helper'ı (block_log_keys) bellek dışı çalıştırır: session'lar ve log, ilk key kolonunun hash'ine
+    göre n_partitions parçaya bölünüp path altına parquet olarak yazılır (prepare_shards), helper her parça için
+    ayrı çalıştırılır ve sonuç sink_parquet ile parça parça diske yazılır (run_shards). Bir key'in tüm satırları
+    aynı parçada olduğu için cum/rolling/decay state'leri tam tablodaki ile aynıdır; n_processes verilmezse
+    bellekte aynı anda sadece bir parça bulunur, verilirse parçalar o kadar process'te paralel çalışır.
+
+    Sonuç, diskteki parçaları okuyan bir LazyFrame'dir ve df'in satır sırasındadır (merge_shards); aligned=True ise
+    sadece yeni kolonları, aksi halde df'in kolonları ile birlikte döndürür. path her çağrıda silinip yeniden yazılır.
+    Log'da aynı (key, zaman) için birden fazla satır varsa helper'ların sort'u bu satırların sırasını garanti
+    etmediğinden son değer (lag) kolonları tam tablodaki çalıştırmadan farklı satırı seçebilir.
+    """
+    prepare_shards(helper, df, path, n_partitions, **params)
+    run_shards(path, n_processes=n_processes)
+    return merge_shards(path, None if aligned else df)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="prepare_shards ile hazırlanmış shard'ları çalıştırır.")
+    parser.add_argument("path")
+    parser.add_argument("--worker", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--processes", type=int, default=None)
+    args = parser.parse_args()
+
+    results = run_shards(args.path, args.worker, args.workers, args.processes)
+    print(f"worker {args.worker}/{args.workers}: {len(results)} shard tamamlandı.")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,9 @@
 import polars as pl
 
+from helpers.alignment import add_row_index, select_aligned, select_required
+from helpers.profiling import record_stage
+
+
 def add_time_history(
     df: pl.DataFrame,
     df_value: pl.DataFrame,
@@ -11,41 +15,111 @@ def add_time_history(
     aggs: list[str] = ["mean","std","min","max","sum"], 
     ratio_aggs: list[str] = ["mean","std","sum"],
     alias: str = "user_sitewide",
-    exact_match: bool = True
+    exact_match: bool = True,
+    aligned: bool = False,
+    required_columns: set[str] = None
 ):
+    """
+    key_col bazında periods pencerelerinde rolling agg, oran ve lag kolonlarını üretip session'lara backward as-of
+    join ile ekler.
+
+    required_columns verilirse sadece bu kolonlar ve onların bağlı olduğu ifadeler kurulur: istenmeyen agg, oran ve
+    lag'ler, hiç kullanılmayan pencere (period) geçişleri ve df_value'nun gereksiz kolonları hiç hesaplanmaz;
+    istenen kolon yoksa join de yapılmaz.
+    """
+    input_cols = df.collect_schema().names()
+
+    # 0 - üretilecek oran, agg ve lag kolonları ile bunların ihtiyaç duyduğu pencere toplamları
+    ratios = [(period, agg, col1, col2) for period in periods for agg in ratio_aggs for col1, col2 in ratio_cols]
+    rollings = [(period, col, agg) for period in periods for col in cols for agg in aggs]
+    lags = list(cols)
+    passthrough = [col for col in df_value.collect_schema().names() if col not in [key_col, index_col] + cols]
+    if required_columns is not None:
+        ratios = [(period, agg, col1, col2) for period, agg, col1, col2 in ratios if f"{alias}_{col1}_to_{col2}_{agg}_{period}_ratio" in required_columns]
+        ratio_inputs = {(period, col, agg) for period, agg, col1, col2 in ratios for col in [col1, col2]}
+        rollings = [(period, col, agg) for period, col, agg in rollings if f"{alias}_rolling_{agg}_{col}_{period}" in required_columns or (period, col, agg) in ratio_inputs]
+        lags = [col for col in lags if f"{alias}_{col}_lag1" in required_columns]
+        passthrough = [col for col in passthrough if col in required_columns]
+
+        if not (rollings or lags or passthrough):
+            return df.select([]) if aligned else df
+        used_cols = [col for col in cols if col in lags or any(col == rolling_col for _, rolling_col, _ in rollings)]
+        df_value = df_value.select([key_col, index_col] + used_cols + passthrough)
+
+    moment_names = {"sum": ["sum"], "mean": ["count", "sum"], "std": ["count", "sum", "sq_sum"], "min": ["count"], "max": ["count"]}
+    moments = list(dict.fromkeys((period, col, name) for period, col, agg in rollings for name in moment_names.get(agg, [])))
+
+    if aligned:
+        df, input_cols = add_row_index(df)
 
     df = df.sort([index_col, key_col])
     df_value = df_value.sort([index_col, key_col])
 
-    for period in periods:
-        df_value = df_value.rolling(
-            index_column=index_col,
-            period=period,
-            by=key_col,
-            closed="left",
-        ).agg([
-            *[getattr(pl.col(col), agg)().alias(f"{alias}_rolling_{agg}_{col}_{period}") for col in cols for agg in aggs]
-        ]).join(df_value, on=[key_col] + [index_col], how="right")
-
-    for period in periods:
-        for agg in ratio_aggs:
-            for col1, col2 in ratio_cols:
-                df_value = df_value.with_columns(
-                    pl.when(pl.col(f"{alias}_rolling_{agg}_{col1}_{period}") > 0)
-                    .then(pl.col(f"{alias}_rolling_{agg}_{col2}_{period}")/pl.col(f"{alias}_rolling_{agg}_{col1}_{period}"))
-                    .otherwise(0)
-                    .alias(f"{alias}_{col1}_to_{col2}_{agg}_{period}_ratio")
-                )
-
-    df_value = df_value.with_columns([pl.col(col).shift(1).over(key_col).alias(f"{alias}_{col}_lag1") for col in cols])
-    df_value = df_value.drop(cols)
-
-    df = df.join_asof(
+    # 1 - tüm pencereler için key bazında tek projeksiyonda pencere sayısı, toplam ve kare toplamı (join yok)
+    # rolling_*_by null değer kabul etmediği için toplamlar null'lar 0 yapılarak, sayı null olmayan değerlerden alınır
+    def _window_sum(expr: pl.Expr, period: str) -> pl.Expr:
+        return expr.rolling_sum_by(index_col, window_size=period, closed="left", min_samples=0).over(key_col)
+
+    moment_exprs = {
+        "count": lambda col: pl.col(col).is_not_null().cast(pl.UInt32),
+        "sum": lambda col: pl.col(col).fill_null(0),
+        "sq_sum": lambda col: (pl.col(col) ** 2).fill_null(0)
+    }
+    df_value = df_value.with_columns(
+        *[_window_sum(moment_exprs[name](col), period).alias(f"_{col}_{name}_{period}") for name in moment_exprs for period, col, moment in moments if moment == name],
+        *[pl.col(col).shift(1).over(key_col).alias(f"{alias}_{col}_lag1") for col in lags]
+    )
+    df_value = record_stage("add_time_history", "1 - window moments", df_value)
+
+    # 2 - agg kolonları; mean/std pencere toplamlarından, min/max rolling_{agg}_by ile
+    # min/max'ta null'lar hiçbir zaman seçilmeyecek sınır değerle doldurulur; pencerede null olmayan değer yoksa null döner
+    value_schema = df_value.collect_schema()
+
+    def _masked(col: str, agg: str) -> pl.Expr:
+        dtype = value_schema[col]
+        if dtype.is_float():
+            bound = pl.lit(float("inf") if agg == "min" else float("-inf"), dtype=dtype)
+        else:
+            bound = dtype.max() if agg == "min" else dtype.min()
+        return pl.col(col).fill_null(bound)
+
+    def _rolling(col: str, agg: str, period: str) -> pl.Expr:
+        count, total, sq_total = (pl.col(f"_{col}_{name}_{period}") for name in ["count", "sum", "sq_sum"])
+        if agg == "sum":
+            return total
+        if agg == "mean":
+            return pl.when(count > 0).then(total / count)
+        if agg == "std":
+            var = (count * sq_total - total ** 2) / (count * (count - 1))
+            return pl.when(count > 1).then(var.clip(lower_bound=0).sqrt())
+        return pl.when(count > 0).then(getattr(_masked(col, agg), f"rolling_{agg}_by")(index_col, window_size=period, closed="left").over(key_col))
+
+    df_value = df_value.with_columns(
+        *[_rolling(col, agg, period).alias(f"{alias}_rolling_{agg}_{col}_{period}") for period, col, agg in rollings]
+    )
+    df_value = record_stage("add_time_history", "2 - rolling aggs", df_value)
+
+    # 3 - oran kolonları tek projeksiyonda
+    df_value = df_value.with_columns(
+        *[pl.when(pl.col(f"{alias}_rolling_{agg}_{col1}_{period}") > 0)
+          .then(pl.col(f"{alias}_rolling_{agg}_{col2}_{period}")/pl.col(f"{alias}_rolling_{agg}_{col1}_{period}"))
+          .otherwise(0)
+          .alias(f"{alias}_{col1}_to_{col2}_{agg}_{period}_ratio")
+          for period, agg, col1, col2 in ratios]
+    )
+
+    df_value = df_value.drop([col for col in cols if col in df_value.collect_schema().names()] + [f"_{col}_{name}_{period}" for period, col, name in moments])
+
+    df = record_stage("add_time_history", "4 - as-of join", df.join_asof(
         df_value, 
         on=index_col, 
         by=key_col, 
         strategy="backward", 
         allow_exact_matches=exact_match
-    )
+    ), inputs=[df, df_value], join=True)
+    df = select_required(df, input_cols, required_columns)
+
+    if aligned:
+        df = select_aligned(df, input_cols)
 
     return df
\ No newline at end of file
@@ -1,50 +1,65 @@
+import os
+
 import polars as pl
 
+from helpers.alignment import add_row_index, select_aligned
+from helpers.profiling import record_stage
 
-def add_user_history(
-    df: pl.DataFrame,
+
+def add_expanding_stats(
     user_df: pl.DataFrame,
-    user_col: str = "user_id_hashed",
-    time_col: str = "ts_hour",
-    interaction_cols: list[str] = ["total_click", "total_fav", "total_cart", "total_order"],
-    ratio_groups: list[tuple[str, str]] = [
-        ("total_click", "total_order"), ("total_click", "total_cart"), 
-        ("total_click", "total_fav"), ("total_cart", "total_order")],
-    alias: str = "user_sitewide",
-    weights: dict[str, float] = {"total_click": 0.204, "total_fav": 0.066, "total_cart": 0.254, "total_order": 0.476},
-    exact_match: bool = False
+    key_cols: list[str],
+    time_col: str,
+    interaction_cols: list[str],
+    alias: str
 ) -> pl.DataFrame:
     """
-    weights = {
-        "ordered": 0.476,
-        "clicked": 0.204,
-        "added_to_cart": 0.254,
-        "added_to_fav": 0.066
-    }
-    weights = {
-        "search": 0.1,
-        "click": 0.9
-    }
-    """
-    _window_size = 10000
+    key_cols bazında zaman sırasına göre tek geçişte expanding istatistikleri ekler:
+    {alias}_{col}_sum, _max, _std, _active_session_count ve {alias}_session_count.
 
-    # 1 - join_asof ve rolling işlemleri için sorting
-    df = df.sort([user_col, time_col])
-    user_df = user_df.sort([user_col, time_col])
+    std, her key'in ilk değerine göre kaydırılmış kümülatif 1. ve 2. momentlerden (n, Σd, Σd²) hesaplanır;
+    satır başına O(1) iş yapar ve log boyutuyla lineer ölçeklenir. Sayım kolonlarında momentler tam sayı
+    olduğundan sonuç Welford ile aynıdır. Tek gözlemli key'lerde std null döner (rolling_std ile aynı).
+    """
 
-    # 2 - rolling kolonlarının oluşturulması
+    user_df = user_df.sort(key_cols + [time_col])
     user_df = user_df.with_columns(
-        *[pl.col(col).cum_sum().over(user_col).fill_null(0).alias(f"{alias}_{col}_sum") for col in interaction_cols],
-        *[pl.col(col).cum_max().over(user_col).fill_null(0).alias(f"{alias}_{col}_max") for col in interaction_cols],
-        *[pl.col(col).rolling_std(window_size=_window_size, min_periods=1).over(user_col).alias(f"{alias}_{col}_std") for col in interaction_cols],
-        *[pl.when(pl.col(col) > 0).then(1).otherwise(0).cum_sum().over(user_col).fill_null(0).alias(f"{alias}_{col}_active_session_count") for col in interaction_cols],
-        pl.col(time_col).cum_count().over(user_col).alias(f"{alias}_session_count")
+        *[(pl.col(col) - pl.col(col).drop_nulls().first().over(key_cols)).alias(f"_{col}_shifted") for col in interaction_cols]
     )
+
+    def _std(col: str) -> pl.Expr:
+        shifted = pl.col(f"_{col}_shifted")
+        n = pl.col(col).cum_count().over(key_cols)
+        s1 = shifted.cum_sum().over(key_cols)
+        s2 = (shifted * shifted).cum_sum().over(key_cols)
+        return pl.when(n > 1).then(((s2 - s1 * s1 / n) / (n - 1)).clip(lower_bound=0).sqrt())
+
+    user_df = user_df.with_columns(
+        *[pl.col(col).cum_sum().over(key_cols).fill_null(0).alias(f"{alias}_{col}_sum") for col in interaction_cols],
+        *[pl.col(col).cum_max().over(key_cols).fill_null(0).alias(f"{alias}_{col}_max") for col in interaction_cols],
+        *[_std(col).alias(f"{alias}_{col}_std") for col in interaction_cols],
+        *[pl.when(pl.col(col) > 0).then(1).otherwise(0).cum_sum().over(key_cols).fill_null(0).alias(f"{alias}_{col}_active_session_count") for col in interaction_cols],
+        pl.col(time_col).cum_count().over(key_cols).alias(f"{alias}_session_count")
+    ).drop([f"_{col}_shifted" for col in interaction_cols])
+
+    return user_df
+
+
+def _add_history_scores(
+    user_df: pl.DataFrame,
+    interaction_cols: list[str],
+    ratio_groups: list[tuple[str, str]],
+    alias: str,
+    weights: dict[str, float]
+) -> pl.DataFrame:
+    """
+    Expanding kolonlarından avg, active session ratio, avg ratio ve weighted score kolonlarını üretir.
+    """
     user_df = user_df.with_columns(
         *[pl.when(pl.col(f"{alias}_{col}_sum") > 0).then(pl.col(f"{alias}_{col}_sum") / pl.col(f"{alias}_session_count")).otherwise(0).alias(f"{alias}_{col}_avg") for col in interaction_cols],
     )
 
-    # 3 - ratio kolonlarının oluşturulması
+    # ratio kolonları
     user_df = user_df.with_columns(
         *[(pl.when(pl.col(f"{alias}_session_count") > 0)
             .then(pl.col(f"{alias}_{col}_active_session_count") / pl.col(f"{alias}_session_count"))
@@ -58,7 +73,7 @@ def add_user_history(
             .otherwise(0).alias(f"{alias}_{col1}_to_{col2}_avg_ratio")
         ))
 
-    # 4 - weighted score kolonlarının oluşturulması
+    # weighted score kolonları
     user_df = user_df.with_columns(
         (pl.lit(0).alias(f"{alias}_weighted_sum_score")),
         (pl.lit(0).alias(f"{alias}_weighted_avg_score"))
@@ -69,11 +84,57 @@ def add_user_history(
             (pl.col(f"{alias}_weighted_avg_score") + (pl.col(f"{alias}_{col}_avg") * weight)).alias(f"{alias}_weighted_avg_score")
         )
 
+    return user_df
+
+
+def add_user_history(
+    df: pl.DataFrame,
+    user_df: pl.DataFrame,
+    user_col: str = "user_id_hashed",
+    time_col: str = "ts_hour",
+    interaction_cols: list[str] = ["total_click", "total_fav", "total_cart", "total_order"],
+    ratio_groups: list[tuple[str, str]] = [
+        ("total_click", "total_order"), ("total_click", "total_cart"), 
+        ("total_click", "total_fav"), ("total_cart", "total_order")],
+    alias: str = "user_sitewide",
+    weights: dict[str, float] = {"total_click": 0.204, "total_fav": 0.066, "total_cart": 0.254, "total_order": 0.476},
+    exact_match: bool = False,
+    aligned: bool = False
+) -> pl.DataFrame:
+    """
+    weights = {
+        "ordered": 0.476,
+        "clicked": 0.204,
+        "added_to_cart": 0.254,
+        "added_to_fav": 0.066
+    }
+    weights = {
+        "search": 0.1,
+        "click": 0.9
+    }
+    """
+    # 1 - join_asof ve rolling işlemleri için sorting
+    if aligned:
+        df, input_cols = add_row_index(df)
+
+    df = df.sort([user_col, time_col])
+
+    # 2 - expanding kolonlarının oluşturulması
+    user_df = add_expanding_stats(user_df, [user_col], time_col, interaction_cols, alias)
+    user_df = record_stage("add_user_history", "2 - expanding stats", user_df)
+
+    # 3, 4 - ratio ve weighted score kolonlarının oluşturulması
+    user_df = _add_history_scores(user_df, interaction_cols, ratio_groups, alias, weights)
+
     # 5 - df ile user_df'in birleştirilmesi
     user_df = user_df.rename({col:f"{alias}_{col}" for col in interaction_cols})
-    df = df.join_asof(user_df, on=time_col, by=user_col, strategy="backward", allow_exact_matches=exact_match)
+    df = record_stage("add_user_history", "5 - as-of join", df.join_asof(user_df, on=time_col, by=user_col, strategy="backward", allow_exact_matches=exact_match),
+                      inputs=[df, user_df], join=True)
     df = df.fill_null(0)
 
+    if aligned:
+        df = select_aligned(df, input_cols)
+
     return df
 
 
@@ -87,58 +148,205 @@ def add_user_term_history(
     alias = "user_term_search",
     ratio_groups: list[tuple[str, str]] = [("total_search_impression", "total_search_click")],
     weights: dict[str, float] = {"total_search_click": 0.9, "total_search_impression": 0.1},
-    exact_match: bool = False
+    exact_match: bool = False,
+    aligned: bool = False
 ) -> pl.DataFrame:
 
     # 1 - join_asof ve rolling işlemleri için sorting
-    _window_size = 10000
+    if aligned:
+        df, input_cols = add_row_index(df)
 
     df = df.sort([user_col, term_col, time_col])
-    user_df = user_df.sort([user_col, term_col, time_col])
 
-    # 2 - rolling kolonlarının oluşturulması
-    user_df = user_df.with_columns(
-        *[pl.col(col).cum_sum().over([user_col,term_col]).fill_null(0).alias(f"{alias}_{col}_sum") for col in interaction_cols],
-        *[pl.col(col).cum_max().over([user_col,term_col]).fill_null(0).alias(f"{alias}_{col}_max") for col in interaction_cols],
-        *[pl.col(col).rolling_std(window_size=_window_size, min_periods=1).over([user_col,term_col]).alias(f"{alias}_{col}_std") for col in interaction_cols],
-        *[pl.when(pl.col(col) > 0).then(1).otherwise(0).cum_sum().over([user_col,term_col]).fill_null(0).alias(f"{alias}_{col}_active_session_count") for col in interaction_cols],
-        pl.col(time_col).cum_count().over([user_col,term_col]).alias(f"{alias}_session_count")
-    )
+    # 2 - expanding kolonlarının oluşturulması
+    user_df = add_expanding_stats(user_df, [user_col, term_col], time_col, interaction_cols, alias)
+    user_df = record_stage("add_user_term_history", "2 - expanding stats", user_df)
+
+    # 3, 4 - ratio ve weighted score kolonlarının oluşturulması
+    user_df = _add_history_scores(user_df, interaction_cols, ratio_groups, alias, weights)
+
+    # 5 - df ile user_df'in birleştirilmesi
+    user_df = user_df.rename({col:f"{alias}_{col}" for col in interaction_cols})
+    df = record_stage("add_user_term_history", "5 - as-of join", df.join_asof(user_df, on=time_col, by=[user_col, term_col], strategy="backward", allow_exact_matches=exact_match),
+                      inputs=[df, user_df], join=True)
+    df = df.fill_null(0)
+
+    if aligned:
+        df = select_aligned(df, input_cols)
+
+    return df
+
+
+STATE_PREFIX = "_state"
+
+
+def _fold_expanding_state(
+    user_df: pl.LazyFrame,
+    key_cols: list[str],
+    time_col: str,
+    interaction_cols: list[str],
+    alias: str,
+    state: pl.DataFrame = None
+) -> tuple[pl.LazyFrame, pl.LazyFrame]:
+    """
+    add_expanding_stats'ın checkpoint'ten devam eden hali; (satırlar, key başına yeni state) döndürür.
+
+    state verilirse key'lerin önceki toplamları (sum, max, std momentleri n/shift/s1/s2, active ve session sayısı)
+    yeni satırların kümülatif değerlerine eklenir; std için kaydırma değeri state'teki ilk değerdir. Böylece
+    satırlar tüm geçmiş üzerinden add_expanding_stats ile hesaplananla aynı olur. Yeni state, her key'in son
+    satırı (as-of join için tüm kolonlarıyla) ve o satıra kadarki toplamlardır.
+    """
+    def _state(col: str, name: str) -> str:
+        return f"{STATE_PREFIX}_{col}_{name}" if col is not None else f"{STATE_PREFIX}_{name}"
+
+    def _plus(expr: pl.Expr, name: str) -> pl.Expr:
+        return expr + pl.col(name).fill_null(0) if state is not None else expr
+
+    # 1 - önceki toplamların key bazında eklenmesi
+    state_cols = [_state(col, name) for col in interaction_cols for name in ["sum", "max", "n", "shift", "s1", "s2", "active"]] + [_state(None, "session_count")]
+    user_df = user_df.lazy()
+    if state is not None:
+        user_df = user_df.join(state.lazy().select(key_cols + state_cols), on=key_cols, how="left")
+    user_df = user_df.sort(key_cols + [time_col])
+
+    def _shift(col: str) -> pl.Expr:
+        first = pl.col(col).drop_nulls().first().over(key_cols)
+        return pl.coalesce(pl.col(_state(col, "shift")), first) if state is not None else first
+
+    user_df = user_df.with_columns(*[_shift(col).alias(f"_{col}_shift") for col in interaction_cols])
+    user_df = user_df.with_columns(*[(pl.col(col) - pl.col(f"_{col}_shift")).alias(f"_{col}_shifted") for col in interaction_cols])
+
+    # 2 - satır bazında kümülatif değerler (add_expanding_stats ile aynı kolonlar)
+    def _max(col: str) -> pl.Expr:
+        running = pl.col(col).cum_max().over(key_cols)
+        return pl.max_horizontal(running, pl.col(_state(col, "max"))) if state is not None else running
+
+    def _std(col: str) -> pl.Expr:
+        n = _plus(pl.col(col).cum_count().over(key_cols), _state(col, "n"))
+        s1 = _plus(pl.col(f"_{col}_shifted").cum_sum().over(key_cols), _state(col, "s1"))
+        s2 = _plus((pl.col(f"_{col}_shifted") * pl.col(f"_{col}_shifted")).cum_sum().over(key_cols), _state(col, "s2"))
+        return pl.when(n > 1).then(((s2 - s1 * s1 / n) / (n - 1)).clip(lower_bound=0).sqrt())
+
     user_df = user_df.with_columns(
-        *[pl.when(pl.col(f"{alias}_{col}_sum") > 0).then(pl.col(f"{alias}_{col}_sum") / pl.col(f"{alias}_session_count")).otherwise(0).alias(f"{alias}_{col}_avg") for col in interaction_cols],
+        *[_plus(pl.col(col).cum_sum().over(key_cols), _state(col, "sum")).fill_null(0).alias(f"{alias}_{col}_sum") for col in interaction_cols],
+        *[pl.when(pl.col(col).is_not_null()).then(_max(col)).fill_null(0).alias(f"{alias}_{col}_max") for col in interaction_cols],
+        *[_std(col).alias(f"{alias}_{col}_std") for col in interaction_cols],
+        *[_plus(pl.when(pl.col(col) > 0).then(1).otherwise(0).cum_sum().over(key_cols), _state(col, "active")).fill_null(0).alias(f"{alias}_{col}_active_session_count") for col in interaction_cols],
+        _plus(pl.col(time_col).cum_count().over(key_cols), _state(None, "session_count")).alias(f"{alias}_session_count")
     )
 
-    # 3 - ratio kolonlarının oluşturulması
+    # 3 - satıra kadarki toplamlar (null değerler atlanarak) ve key başına son satır
     user_df = user_df.with_columns(
-        *[(pl.when(pl.col(f"{alias}_session_count") > 0)
-            .then(pl.col(f"{alias}_{col}_active_session_count") / pl.col(f"{alias}_session_count"))
-            .otherwise(0)).alias(f"{alias}_{col}_active_session_ratio") for col in interaction_cols]
-    )
+        *[_plus(pl.col(col).fill_null(0).cum_sum().over(key_cols), _state(col, "sum")).alias(_state(col, "sum")) for col in interaction_cols],
+        *[(pl.max_horizontal(pl.col(col).cum_max().forward_fill().over(key_cols), pl.col(_state(col, "max"))) if state is not None
+           else pl.col(col).cum_max().forward_fill().over(key_cols)).alias(_state(col, "max")) for col in interaction_cols],
+        *[_plus(pl.col(col).cum_count().over(key_cols), _state(col, "n")).alias(_state(col, "n")) for col in interaction_cols],
+        *[pl.col(f"_{col}_shift").alias(_state(col, "shift")) for col in interaction_cols],
+        *[_plus(pl.col(f"_{col}_shifted").fill_null(0).cum_sum().over(key_cols), _state(col, "s1")).alias(_state(col, "s1")) for col in interaction_cols],
+        *[_plus((pl.col(f"_{col}_shifted") * pl.col(f"_{col}_shifted")).fill_null(0).cum_sum().over(key_cols), _state(col, "s2")).alias(_state(col, "s2")) for col in interaction_cols],
+        *[pl.col(f"{alias}_{col}_active_session_count").alias(_state(col, "active")) for col in interaction_cols],
+        pl.col(f"{alias}_session_count").alias(_state(None, "session_count"))
+    ).drop([f"_{col}_{suffix}" for col in interaction_cols for suffix in ["shift", "shifted"]])
 
-    for col1, col2 in ratio_groups:
-        user_df = user_df.with_columns((
-            pl.when(pl.col(f"{alias}_{col1}_avg") > 0)
-            .then(pl.col(f"{alias}_{col2}_avg") / pl.col(f"{alias}_{col1}_avg"))
-            .otherwise(0).alias(f"{alias}_{col1}_to_{col2}_avg_ratio")
-        ))
+    user_df = user_df.select(pl.exclude(state_cols), *state_cols)
+    rows = user_df.drop(state_cols)
+    new_state = user_df.unique(subset=key_cols, keep="last", maintain_order=True)
+    if state is not None:
+        new_state = pl.concat([
+            state.lazy().join(new_state.select(key_cols), on=key_cols, how="anti").select(new_state.collect_schema().names()),
+            new_state
+        ])
 
-    # 4 - weighted score kolonlarının oluşturulması
-    user_df = user_df.with_columns(
-        (pl.lit(0).alias(f"{alias}_weighted_sum_score")),
-        (pl.lit(0).alias(f"{alias}_weighted_avg_score"))
-    )
-    for col, weight in weights.items():
-        user_df = user_df.with_columns(
-            (pl.col(f"{alias}_weighted_sum_score") + (pl.col(f"{alias}_{col}_sum") * weight)).alias(f"{alias}_weighted_sum_score"),
-            (pl.col(f"{alias}_weighted_avg_score") + (pl.col(f"{alias}_{col}_avg") * weight)).alias(f"{alias}_weighted_avg_score")
-        )
+    return rows, new_state
 
-    # 5 - df ile user_df'in birleştirilmesi
-    user_df = user_df.rename({col:f"{alias}_{col}" for col in interaction_cols})
-    df = df.join_asof(user_df, on=time_col, by=[user_col, term_col], strategy="backward", allow_exact_matches=exact_match)
+
+def build_user_history_state(
+    user_df: pl.DataFrame,
+    user_col: str = "user_id_hashed",
+    time_col: str = "ts_hour",
+    interaction_cols: list[str] = ["total_click", "total_fav", "total_cart", "total_order"],
+    alias: str = "user_sitewide",
+    term_col: str = None,
+    path: str = None
+) -> pl.DataFrame:
+    """
+    add_user_history (term_col verilirse add_user_term_history) için user_df'in tamamından key başına kümülatif
+    state'i kurar: son log satırının expanding kolonları, sum/max/active/session sayıları ve std için Welford
+    yerine kullanılan kaydırılmış momentler (n, shift, s1, s2). State'in watermark'ı en büyük time_col değeridir.
+    path verilirse state parquet olarak yazılır.
+    """
+    _, state = _fold_expanding_state(user_df, [user_col] + ([term_col] if term_col is not None else []), time_col, interaction_cols, alias)
+    state = state.collect()
+    if path is not None:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        state.write_parquet(path)
+    return state
+
+
+def update_user_history(
+    df: pl.DataFrame,
+    new_user_df: pl.DataFrame,
+    state: pl.DataFrame,
+    user_col: str = "user_id_hashed",
+    time_col: str = "ts_hour",
+    interaction_cols: list[str] = ["total_click", "total_fav", "total_cart", "total_order"],
+    ratio_groups: list[tuple[str, str]] = [
+        ("total_click", "total_order"), ("total_click", "total_cart"),
+        ("total_click", "total_fav"), ("total_cart", "total_order")],
+    alias: str = "user_sitewide",
+    weights: dict[str, float] = {"total_click": 0.204, "total_fav": 0.066, "total_cart": 0.254, "total_order": 0.476},
+    exact_match: bool = False,
+    aligned: bool = False,
+    term_col: str = None,
+    path: str = None
+) -> tuple[pl.DataFrame, pl.DataFrame]:
+    """
+    Checkpoint'lenmiş state'e (build_user_history_state) sadece watermark'tan sonraki yeni log satırlarını ekler ve
+    df'teki yeni session'lar için add_user_history (term_col verilirse add_user_term_history) ile aynı kolonları
+    üretir; (df, yeni state) döndürür. Tüm geçmiş yeniden taranmaz, iş yeni log satırları ve key başına tek state
+    satırı kadardır. Sayım kolonlarında sonuç tüm geçmişin yeniden hesaplanmasıyla birebir aynıdır.
+
+    Session'lar watermark'tan sonra (exact_match=True ise watermark dahil) olmalıdır; watermark'tan önceki veya ona
+    eşit zamanlı yeni log satırları state'te zaten var sayılıp atlanır. path verilirse yeni state parquet olarak yazılır.
+    """
+    key_cols = [user_col] + ([term_col] if term_col is not None else [])
+    if isinstance(state, pl.LazyFrame):
+        state = state.collect()
+
+    # 1 - session'ların watermark'tan sonra olduğunun kontrolü
+    watermark = state[time_col].max()
+    first_session = df.lazy().select(pl.col(time_col).min()).collect().item()
+    if watermark is not None and first_session is not None and (first_session < watermark or (first_session == watermark and not exact_match)):
+        raise ValueError(f"Session'lar state watermark'ından ({watermark}) sonra olmalıdır; en erken session: {first_session}.")
+
+    if aligned:
+        df, input_cols = add_row_index(df)
+
+    # 2 - yeni log satırlarının state'e eklenmesi
+    new_user_df = new_user_df.lazy()
+    if watermark is not None:
+        new_user_df = new_user_df.filter(pl.col(time_col) > watermark)
+    rows, new_state = _fold_expanding_state(new_user_df, key_cols, time_col, interaction_cols, alias, state)
+
+    # 3 - state'teki son satırlar ve yeni satırlar üzerinden ratio/score kolonları ve as-of join
+    user_df = pl.concat([state.lazy().select(rows.collect_schema().names()), rows]).sort(key_cols + [time_col])
+    user_df = _add_history_scores(user_df, interaction_cols, ratio_groups, alias, weights)
+    user_df = user_df.rename({col: f"{alias}_{col}" for col in interaction_cols})
+
+    lazy = isinstance(df, pl.LazyFrame)
+    df = df.lazy().sort(key_cols + [time_col]).join_asof(user_df, on=time_col, by=key_cols, strategy="backward", allow_exact_matches=exact_match)
     df = df.fill_null(0)
 
-    return df
+    if aligned:
+        df = select_aligned(df, input_cols)
+
+    # 4 - yeni state'in kaydedilmesi
+    new_state = new_state.collect()
+    if path is not None:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        new_state.write_parquet(path)
+
+    return (df if lazy else df.collect()), new_state
 
 
 def add_user_term_to_all_ratios(
@@ -165,9 +373,13 @@ def add_user_term_to_all_ratios(
 def add_user_metadata(
     df: pl.DataFrame,
     user_metadata: pl.DataFrame,
-    user_col: str
+    user_col: str,
+    aligned: bool = False
 ) -> pl.DataFrame:
 
+    if aligned:
+        df, input_cols = add_row_index(df)
+
     user_metadata = user_metadata.with_columns(
         (2025 - (pl.when(pl.col("user_birth_year").is_not_null())
         .then(pl.when(pl.col("user_birth_year") < 1960).then(1960).otherwise(pl.col("user_birth_year")))
@@ -196,4 +408,7 @@ def add_user_metadata(
         how="left"
     )
 
+    if aligned:
+        df = select_aligned(df, input_cols)
+
     return df
\ No newline at end of file